@@ -1,22 +1,96 @@
 # app.py
 """Main application file for the Language Audiobook Translator."""
 
+import time
 import streamlit as st
-from config import PAGE_CONFIG, LANGUAGES
+from config import PAGE_CONFIG, LANGUAGES, QUEUE_SETTINGS
 from ui_components import (
     render_header,
     render_input_section,
     display_file_info,
+    display_job_progress,
     display_transcription_results,
     display_translation_results,
     display_final_results,
+    display_conversion_error,
     render_sidebar,
     render_footer
 )
-from audio_processor import convert_audio_format, get_audio_info
-from speech_recognition_module import transcribe_audio
-from translation_module import translate_text, translate_text_alternative
-from text_to_speech import text_to_speech
+from errors import AudioConversionError, FFmpegNotFoundError
+from job_store import open_job_store
+from job_queue import submit_jobs, job_progress, ensure_workers
+from text_utils import join_segments
+
+# Language names by code, for jobs submitted earlier in the session
+LANGUAGE_NAMES = {code: name for name, code in LANGUAGES.items()}
+
+# Conversion failures recorded by the workers, by exception name
+CONVERSION_ERRORS = {error.__name__: error for error in (AudioConversionError, FFmpegNotFoundError)}
+
+
+def show_jobs(job_ids):
+    """Show the jobs submitted together, one tab per target language.
+
+    Returns True while any of them is still waiting or running.
+    """
+    jobs = [job for job in (job_progress(job_id) for job_id in job_ids) if job is not None]
+    if len(jobs) <= 1:
+        return bool(jobs) and show_job(jobs[0])
+
+    running = False
+    tabs = st.tabs([LANGUAGE_NAMES.get(job["target"], job["target"]) for job in jobs])
+    for tab, job in zip(tabs, jobs):
+        with tab:
+            running = show_job(job) or running
+    return running
+
+
+def show_job(job):
+    """Show a submitted job: progress and partial results while it runs, everything once it's done.
+
+    Returns True while the job is still waiting or running.
+    """
+    transcribed_text = " ".join(job["transcript"])
+    translated_text = join_segments(job["translation"], job["target"])
+
+    if job["status"] in ("pending", "queued", "running"):
+        display_job_progress(job, transcribed_text, translated_text)
+        return True
+
+    if job["status"] == "failed":
+        if job["error_type"] in CONVERSION_ERRORS:
+            display_conversion_error(CONVERSION_ERRORS[job["error_type"]](job["error"]))
+            return False
+        st.error(f"Processing failed: {job['error']}")
+        st.info("💡 **Troubleshooting Tips:**")
+        st.write("- Check your internet connection")
+        st.write("- Try a shorter audio sample")
+        st.write("- Install alternative translator: `pip install deep_translator`")
+        st.write("- Press Start again to resume from the last finished segment")
+        return False
+
+    if not transcribed_text:
+        st.error("Transcription failed: Could not understand audio - try with clearer audio")
+        return False
+
+    # Display transcribed text with audio info
+    display_transcription_results(transcribed_text, job["audio_info"], key=job["id"])
+
+    # Display translated text
+    display_translation_results(translated_text, key=job["id"])
+
+    # Display results, played and downloaded straight from the job's files
+    display_final_results(
+        open_job_store().output_path(job["id"]),
+        job["chapter_paths"],
+        job["name"],
+        transcribed_text,
+        translated_text,
+        LANGUAGE_NAMES.get(job["source"], job["source"]),
+        LANGUAGE_NAMES.get(job["target"], job["target"]),
+        key=job["id"]
+    )
+    return False
 
 
 def main():
@@ -24,11 +98,14 @@ def main():
     # Configure the page
     st.set_page_config(**PAGE_CONFIG)
 
+    # Processing happens in background worker processes, started with the first page view
+    ensure_workers()
+
     # Render UI components
     render_header()
 
     # Get user inputs
-    uploaded_file, source_language, target_language, chunk_size = render_input_section()
+    uploaded_file, source_language, target_languages, chunk_size, asr_backend = render_input_section()
 
     # Processing section
     if uploaded_file is not None:
@@ -37,90 +114,29 @@ def main():
         # Display file info
         display_file_info(uploaded_file)
 
+        if not target_languages:
+            st.warning("Pick at least one target language")
+
         # Process button
-        if st.button("🚀 Start Translation Process", type="primary"):
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-
-            try:
-                # Step 1: Convert audio format
-                status_text.text("Converting audio format...")
-                progress_bar.progress(10)
-
-                wav_audio = convert_audio_format(uploaded_file)
-                if wav_audio is None:
-                    st.error("Failed to convert audio format")
-                    st.stop()
-
-                # Step 2: Transcribe audio
-                status_text.text("Converting speech to text...")
-                progress_bar.progress(30)
-
-                source_lang_code = LANGUAGES[source_language]
-                transcribed_text = transcribe_audio(wav_audio, source_lang_code)
-
-                if "error" in transcribed_text.lower() or "could not understand" in transcribed_text.lower():
-                    st.error(f"Transcription failed: {transcribed_text}")
-                    st.stop()
-
-                # Display transcribed text with audio info
-                audio_info = get_audio_info(wav_audio)
-                display_transcription_results(transcribed_text, audio_info)
-
-                # Step 3: Translate text
-                status_text.text("Translating text...")
-                progress_bar.progress(60)
-
-                target_lang_code = LANGUAGES[target_language]
-                translated_text = translate_text(transcribed_text, source_lang_code, target_lang_code)
-
-                # If primary translation fails, try alternative method
-                if "error" in translated_text.lower():
-                    status_text.text("Trying alternative translation method...")
-                    translated_text = translate_text_alternative(transcribed_text, source_lang_code, target_lang_code)
-
-                if "error" in translated_text.lower() or "failed" in translated_text.lower():
-                    st.error(f"Translation failed: {translated_text}")
-                    st.info("💡 **Troubleshooting Tips:**")
-                    st.write("- Check your internet connection")
-                    st.write("- Try a shorter text sample")
-                    st.write("- Install alternative translator: `pip install deep_translator`")
-                    st.stop()
-
-                # Display translated text
-                display_translation_results(translated_text)
-
-                # Step 4: Convert to speech
-                status_text.text("Converting text to speech...")
-                progress_bar.progress(80)
-
-                audio_buffer = text_to_speech(translated_text, target_lang_code)
-                if audio_buffer is None:
-                    st.error("Failed to generate speech")
-                    st.stop()
-
-                # Step 5: Complete
-                status_text.text("Translation complete!")
-                progress_bar.progress(100)
-
-                # Display results
-                display_final_results(
-                    audio_buffer,
-                    uploaded_file,
-                    transcribed_text,
-                    translated_text,
-                    source_language,
-                    target_language
-                )
-
-            except Exception as e:
-                st.error(f"An error occurred during processing: {str(e)}")
-                status_text.text("Processing failed")
+        if st.button("🚀 Start Translation Process", type="primary", disabled=not target_languages):
+            # The same file and settings always map to the same jobs, so a rerun picks up where it stopped
+            job_ids = submit_jobs(
+                uploaded_file, uploaded_file.name, LANGUAGES[source_language],
+                [LANGUAGES[language] for language in target_languages], chunk_size, asr_backend
+            )
+            st.session_state["job_ids"] = list(job_ids.values())
+
+    running = show_jobs(st.session_state.get("job_ids", []))
 
     # Render sidebar and footer
     render_sidebar()
     render_footer()
 
+    if running:
+        # Poll again shortly; the work itself happens in the worker processes
+        time.sleep(QUEUE_SETTINGS["poll_interval"])
+        st.rerun()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
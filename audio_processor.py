@@ -1,74 +1,311 @@
 # audio_processor.py
 """Audio processing functions for the Language Audiobook Translator."""
 
-import io
-import streamlit as st
-from pydub import AudioSegment
-from config import AUDIO_SETTINGS
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import wave
+import numpy as np
+from config import AUDIO_SETTINGS, CONVERSION_SETTINGS
+from errors import AudioConversionError, FFmpegNotFoundError
 
+# WAV format tags we can read directly
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
 
-def convert_audio_format(audio_file):
-    """Convert audio file to WAV format for speech recognition with improved settings."""
+# Half-width, in input samples, of the anti-aliasing filter used when downsampling
+RESAMPLE_FILTER_HALF_WIDTH = 32
+
+
+def probe_wav(wav_file):
+    """Read a WAV file's format from its RIFF headers without touching the audio data.
+
+    Returns a dict with format_tag, extensible, channels, sample_rate,
+    sample_width, frames, duration, data_offset and data_size, or None if
+    the file is not a WAV file. The file is left rewound.
+    """
+    wav_file.seek(0, 2)
+    file_size = wav_file.tell()
+    wav_file.seek(0)
     try:
-        # First, try to use the file directly if it's already WAV
-        if audio_file.name.lower().endswith('.wav'):
-            return audio_file
+        header = wav_file.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return None
+
+        info = None
+        while True:
+            chunk = wav_file.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+
+            if chunk_id == b'fmt ':
+                fmt = wav_file.read(size)
+                format_tag, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+                extensible = format_tag == WAVE_FORMAT_EXTENSIBLE
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                    # The real format is the first two bytes of the sub-format GUID
+                    format_tag = struct.unpack('<H', fmt[24:26])[0]
+                info = {
+                    "format_tag": format_tag,
+                    "extensible": extensible,
+                    "channels": channels,
+                    "sample_rate": sample_rate,
+                    "sample_width": bits // 8
+                }
+                wav_file.seek(size % 2, 1)
+
+            elif chunk_id == b'data':
+                if info is None:
+                    return None
+                offset = wav_file.tell()
+                # Streamed WAVs may leave the size unset - trust the file size instead
+                size = min(size, file_size - offset)
+                frame_size = info["channels"] * info["sample_width"] or 1
+                info.update({
+                    "data_offset": offset,
+                    "data_size": size,
+                    "frames": size // frame_size,
+                    "duration": size // frame_size / info["sample_rate"] if info["sample_rate"] else 0.0
+                })
+                return info
+
+            else:
+                wav_file.seek(size + size % 2, 1)
+    finally:
+        wav_file.seek(0)
+
+
+def is_recognizer_ready(info):
+    """True if a probed WAV is already the 16-bit mono PCM at the rate the recognizer expects."""
+    # The wave module later stages read with only knows the plain PCM header, not WAVE_FORMAT_EXTENSIBLE
+    return (info["format_tag"] == WAVE_FORMAT_PCM and not info["extensible"] and info["sample_width"] == 2
+            and info["channels"] == AUDIO_SETTINGS["channels"]
+            and info["sample_rate"] == AUDIO_SETTINGS["sample_rate"])
+
+
+def _raw_view(wav_file, info):
+    """Return the WAV's audio data as a uint8 array that views or memory-maps it, never copies it."""
+    if hasattr(wav_file, 'getbuffer'):
+        return np.frombuffer(wav_file.getbuffer(), dtype=np.uint8,
+                             count=info["data_size"], offset=info["data_offset"])
+    return np.memmap(wav_file, dtype=np.uint8, mode='r', offset=info["data_offset"], shape=(info["data_size"],))
+
+
+def _decode_frames(raw, info):
+    """Decode whole frames of raw WAV bytes to a (frames, channels) float32 array in [-1, 1]."""
+    width, channels = info["sample_width"], info["channels"]
+    if info["format_tag"] == WAVE_FORMAT_IEEE_FLOAT:
+        samples = raw.view('<f4' if width == 4 else '<f8').astype(np.float32)
+    elif width == 1:
+        samples = (raw.astype(np.float32) - 128) / 128
+    elif width == 3:
+        # Assemble the little-endian 24-bit samples, then sign-extend through the top byte
+        triples = raw.reshape(-1, 3).astype(np.int32)
+        values = triples[:, 0] | (triples[:, 1] << 8) | (triples[:, 2] << 16)
+        samples = ((values << 8) >> 8).astype(np.float32) / 2 ** 23
+    else:
+        dtype = np.dtype({2: '<i2', 4: '<i4'}[width])
+        samples = raw.view(dtype).astype(np.float32) / -float(np.iinfo(dtype).min)
+    return samples.reshape(-1, channels)
+
+
+def _lowpass_filter(in_rate, out_rate):
+    """Windowed-sinc low-pass filter that removes what would alias when resampling to out_rate."""
+    cutoff = 0.45 * out_rate / in_rate
+    taps = np.arange(-RESAMPLE_FILTER_HALF_WIDTH, RESAMPLE_FILTER_HALF_WIDTH + 1)
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def resample_wav(wav_file, info):
+    """Convert a PCM or float WAV to 16 kHz mono 16-bit PCM in a temporary file, block by block.
+
+    Channels are averaged, then the audio is low-pass filtered (when
+    downsampling) and linearly interpolated onto the new sample grid, all
+    vectorized over blocks of CONVERSION_SETTINGS["block_bytes"]. The result
+    is normalized the same way as FFmpeg-converted audio.
+    """
+    out_rate = AUDIO_SETTINGS["sample_rate"]
+    in_rate = info["sample_rate"]
+    frame_size = info["channels"] * info["sample_width"]
+    raw = _raw_view(wav_file, info) if info["data_size"] else np.zeros(0, dtype=np.uint8)
+    n_in = info["frames"]
+    ratio = in_rate / out_rate
+    n_out = int(n_in / ratio)
+    kernel = _lowpass_filter(in_rate, out_rate) if in_rate > out_rate else None
+    margin = RESAMPLE_FILTER_HALF_WIDTH + 2
+
+    wav_out = tempfile.TemporaryFile(suffix=".wav")
+    peak = 0
+    with wave.open(wav_out, 'wb') as wav:
+        wav.setnchannels(AUDIO_SETTINGS["channels"])
+        wav.setsampwidth(2)
+        wav.setframerate(out_rate)
+
+        block = max(1, CONVERSION_SETTINGS["block_bytes"] // 2)
+        for out_start in range(0, n_out, block):
+            positions = np.arange(out_start, min(out_start + block, n_out)) * ratio
+            # Read a little either side so the filter has context at block edges
+            lo = max(0, int(positions[0]) - margin)
+            hi = min(n_in, int(positions[-1]) + margin)
+            mono = _decode_frames(raw[lo * frame_size:hi * frame_size], info).mean(axis=1)
+            if kernel is not None:
+                mono = np.convolve(mono, kernel, mode='same')
+            resampled = np.interp(positions - lo, np.arange(len(mono)), mono)
+            pcm = np.clip(np.rint(resampled * 32767), -32768, 32767).astype('<i2')
+            if len(pcm):
+                peak = max(peak, int(pcm.max()), -int(pcm.min()))
+            wav.writeframesraw(pcm.tobytes())
+    del raw
+
+    if peak:
+        _apply_gain(wav_out, 32767 * 10 ** (-CONVERSION_SETTINGS["headroom_db"] / 20) / peak)
+    wav_out.seek(0)
+    return wav_out
 
-        # Try using pydub with FFmpeg
-        audio = AudioSegment.from_file(audio_file)
 
-        # Improve audio for speech recognition
-        # Normalize audio level
-        audio = audio.normalize()
+def _find_ffmpeg():
+    """Return the FFmpeg executable pydub is configured with, or the one on PATH."""
+    from pydub import AudioSegment
 
-        # Ensure mono audio (speech recognition works better with mono)
-        if audio.channels > 1:
-            audio = audio.set_channels(AUDIO_SETTINGS["channels"])
+    for candidate in (AudioSegment.converter, "ffmpeg"):
+        path = shutil.which(candidate)
+        if path:
+            return path
+    raise FileNotFoundError("ffmpeg")
 
-        # Set sample rate to 16kHz (optimal for speech recognition)
-        audio = audio.set_frame_rate(AUDIO_SETTINGS["sample_rate"])
 
-        # Export to WAV with better settings
-        wav_io = io.BytesIO()
-        audio.export(
-            wav_io,
-            format="wav",
-            parameters=["-ac", "1", "-ar", "16000"]  # Mono, 16kHz
-        )
-        wav_io.seek(0)
+def _input_path(audio_file, spool):
+    """Return a path FFmpeg can read the audio from, copying uploads to the spool file if needed."""
+    path = getattr(audio_file, 'name', None)
+    if isinstance(path, str) and os.path.isfile(path):
+        return path
+    # Uploads only live in memory; containers like M4A need a seekable file, so no stdin pipe
+    audio_file.seek(0)
+    shutil.copyfileobj(audio_file, spool, CONVERSION_SETTINGS["block_bytes"])
+    spool.flush()
+    return spool.name
 
-        return wav_io
+
+def _decode_to_wav(input_path, wav_file):
+    """Decode any FFmpeg-readable file to 16 kHz mono 16-bit WAV in fixed-size blocks.
+
+    Returns the peak absolute sample value, found along the way for normalization.
+    """
+    command = [
+        _find_ffmpeg(), "-nostdin", "-v", "error", "-i", input_path,
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ac", str(AUDIO_SETTINGS["channels"]), "-ar", str(AUDIO_SETTINGS["sample_rate"]),
+        "pipe:1"
+    ]
+    peak = 0
+    with tempfile.TemporaryFile() as errors, \
+            subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors) as ffmpeg, \
+            wave.open(wav_file, 'wb') as wav:
+        wav.setnchannels(AUDIO_SETTINGS["channels"])
+        wav.setsampwidth(2)
+        wav.setframerate(AUDIO_SETTINGS["sample_rate"])
+
+        leftover = b''
+        while True:
+            block = ffmpeg.stdout.read(CONVERSION_SETTINGS["block_bytes"])
+            if not block:
+                break
+            block = leftover + block
+            # Keep whole samples only; an odd trailing byte waits for the next block
+            usable = len(block) - len(block) % 2
+            block, leftover = block[:usable], block[usable:]
+            samples = np.frombuffer(block, dtype='<i2')
+            if len(samples):
+                peak = max(peak, int(samples.max()), -int(samples.min()))
+            wav.writeframesraw(block)
+
+        if ffmpeg.wait() != 0:
+            errors.seek(0)
+            raise AudioConversionError(f"Audio conversion issue: {errors.read().decode(errors='replace').strip()}")
+    return peak
+
+
+def _apply_gain(wav_file, gain):
+    """Scale the samples of a 16-bit WAV file in place, one memory-mapped block at a time."""
+    wav_file.seek(0)
+    with wave.open(wav_file, 'rb') as wav:
+        data_start = wav_file.tell()
+        count = wav.getnframes() * wav.getnchannels()
+    if not count:
+        return
+
+    samples = np.memmap(wav_file, dtype='<i2', mode='r+', offset=data_start, shape=(count,))
+    block = CONVERSION_SETTINGS["block_bytes"] // 2
+    for start in range(0, count, block):
+        scaled = samples[start:start + block] * np.float32(gain)
+        samples[start:start + block] = np.clip(np.rint(scaled), -32768, 32767).astype('<i2')
+    samples.flush()
+    del samples
+
+
+def convert_audio_streaming(audio_file):
+    """Convert audio to normalized 16 kHz mono WAV in a temporary file, using a fixed amount of memory.
+
+    FFmpeg decodes the audio in blocks straight to disk while the peak level
+    is tracked; a second pass over the memory-mapped file then applies the
+    normalization gain (the same headroom pydub's normalize() uses). Returns
+    the open temporary file, rewound, which is deleted once closed.
+    """
+    wav_file = tempfile.TemporaryFile(suffix=".wav")
+    try:
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(getattr(audio_file, 'name', ''))[1]) as spool:
+            peak = _decode_to_wav(_input_path(audio_file, spool), wav_file)
+
+        if peak:
+            target = 32767 * 10 ** (-CONVERSION_SETTINGS["headroom_db"] / 20)
+            _apply_gain(wav_file, target / peak)
+
+        wav_file.seek(0)
+        return wav_file
+    except BaseException:
+        wav_file.close()
+        raise
+
+
+def convert_audio_format(audio_file):
+    """Convert audio file to WAV format for speech recognition with improved settings.
+
+    Raises FFmpegNotFoundError when FFmpeg is missing and AudioConversionError
+    for anything else that stops the file from being decoded.
+    """
+    try:
+        if audio_file.name.lower().endswith('.wav'):
+            info = probe_wav(audio_file)
+            if info and is_recognizer_ready(info):
+                # Already what the recognizer wants - later stages map it without copying
+                return audio_file
+            if info and info["format_tag"] in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+                return resample_wav(audio_file, info)
+            # Compressed or unusual WAV - let FFmpeg decode it
+
+        # Decode with FFmpeg to a normalized, mono, 16kHz file on disk
+        return convert_audio_streaming(audio_file)
 
     except FileNotFoundError as e:
-        # FFmpeg not found - provide user-friendly error with solutions
-        st.error("""
-        🚨 **FFmpeg Not Found!**
-
-        **Quick Fixes (choose one):**
-
-        1️⃣ **Easiest - Use WAV files:**
-           - Convert your audio to WAV format first
-           - Use VLC Player: Media → Convert/Save
-           - Or use online converter: convertio.co
-
-        2️⃣ **Install FFmpeg:**
-           ```
-           # In Command Prompt as Administrator:
-           winget install FFmpeg
-           ```
-
-        3️⃣ **Alternative install:**
-           ```
-           pip install imageio[ffmpeg]
-           ```
-        """)
-        return None
+        # FFmpeg not found
+        raise FFmpegNotFoundError("FFmpeg not found - install FFmpeg or use a WAV file") from e
+
+    except AudioConversionError:
+        raise
 
     except Exception as e:
-        # For other errors, try alternative approach
-        st.warning(f"Audio conversion issue: {str(e)}")
-        st.info("💡 **Try uploading a WAV file instead** - no conversion needed!")
-        return None
+        raise AudioConversionError(f"Audio conversion issue: {str(e)}") from e
+
+
+def get_audio_duration(wav_audio):
+    """Return the duration of a WAV file in seconds, read from its header."""
+    info = probe_wav(wav_audio)
+    return info["duration"] if info else 0.0
 
 
 def get_audio_info(wav_audio):
@@ -76,11 +313,10 @@ def get_audio_info(wav_audio):
     if wav_audio:
         try:
             if hasattr(wav_audio, 'seek'):
-                wav_audio.seek(0)  # Reset position
-                temp_audio = AudioSegment.from_wav(wav_audio)
-                duration = len(temp_audio) / 1000.0  # Duration in seconds
-                sample_rate = temp_audio.frame_rate
-                return f"🎵 Audio Info: {duration:.1f} seconds, {sample_rate} Hz sample rate"
+                # Only the headers are read, however long the audio is
+                info = probe_wav(wav_audio)
+                if info:
+                    return f"🎵 Audio Info: {info['duration']:.1f} seconds, {info['sample_rate']} Hz sample rate"
         except:
             pass
     return None
\ No newline at end of file
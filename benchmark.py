@@ -0,0 +1,384 @@
+# benchmark.py
+"""Offline benchmarks for the processing stages of the Language Audiobook Translator.
+
+Generates synthetic speech-like audio, runs each stage - and the whole
+pipeline - against the local stub backends, and reports throughput (seconds
+of audio per wall-clock second), per-item latency percentiles and peak
+memory. It also times a cold start of the Streamlit app: importing app.py
+and rendering its first page. Results are saved as JSON and can be
+compared with an earlier run:
+
+    python benchmark.py --duration 600 --format mp3 --output before.json
+    python benchmark.py --duration 600 --format mp3 --compare before.json
+
+Every stage runs in a fresh process, so its peak RSS is its own. Exit
+status is 1 when --compare finds a regression.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from config import BENCHMARK_SETTINGS, SUPPORTED_AUDIO_FORMATS, AUDIO_SETTINGS
+
+STAGES = ("convert", "segment", "transcribe", "translate", "synthesize", "pipeline")
+
+# Timing differences smaller than this are noise, not regressions
+NOISE_FLOOR_S = 0.01
+
+# Libraries the app should not load before its first page is shown
+HEAVY_MODULES = ("googletrans", "gtts", "speech_recognition", "pydub", "deep_translator", "numpy")
+
+# Run in a fresh interpreter: import the app, then render its first page with Streamlit's test runner
+_STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+heavy = [name for name in json.loads(sys.argv[1]) if name in sys.modules]
+from streamlit.testing.v1 import AppTest
+test = AppTest.from_file(app.__file__, default_timeout=60)
+ready = time.perf_counter()
+test.run()
+rendered = time.perf_counter()
+print(json.dumps({"import_s": imported - started, "render_s": rendered - ready, "heavy_modules": heavy,
+                  "errors": len(test.exception)}))
+"""
+
+# Words for the synthetic text given to the translation and speech stages
+WORDS = ("the old house stood at the end of a quiet road where the river turned toward the hills and "
+         "every morning she walked down to the water to watch the boats go by before the town woke up").split()
+
+
+def synthetic_speech(path, duration, sample_rate=44100, channels=2, seed=0):
+    """Write duration seconds of speech-like 16-bit WAV to path.
+
+    Sentences of voiced, syllable-modulated harmonics with a drifting pitch
+    and a little noise are separated by short pauses, so voice activity
+    detection and silence-based chunking see something like real speech.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Alternate sentences (2-6 s) and pauses (0.3-1.0 s)
+    bounds, t = [], 0.0
+    while t < duration:
+        length = rng.uniform(2.0, 6.0)
+        bounds.append((t, min(t + length, duration)))
+        t += length + rng.uniform(0.3, 1.0)
+    starts = np.array([start for start, _ in bounds])
+    ends = np.array([end for _, end in bounds])
+
+    total = int(duration * sample_rate)
+    block = sample_rate * 10
+    phase = 0.0
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        for offset in range(0, total, block):
+            times = np.arange(offset, min(offset + block, total)) / sample_rate
+            sentence = np.searchsorted(starts, times, side="right") - 1
+            voiced = (sentence >= 0) & (times < ends[np.maximum(sentence, 0)])
+
+            # Pitch drifts between ~110 and ~190 Hz; syllables at ~4.5 per second
+            pitch = 150 + 40 * np.sin(2 * np.pi * 0.3 * times)
+            phases = phase + np.cumsum(2 * np.pi * pitch / sample_rate)
+            phase = float(phases[-1])
+            tone = sum(np.sin(k * phases) / k for k in range(1, 6))
+            syllables = np.abs(np.sin(np.pi * 4.5 * times)) ** 0.5
+
+            signal = 0.25 * tone * syllables * voiced + rng.normal(0, 0.003, len(times))
+            samples = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+            wav.writeframes(np.repeat(samples, channels).tobytes() if channels > 1 else samples.tobytes())
+    return path
+
+
+def encode(wav_path, audio_format):
+    """Transcode the WAV to audio_format with FFmpeg, returning the new file's path."""
+    if audio_format == "wav":
+        return wav_path
+    path = os.path.splitext(wav_path)[0] + "." + audio_format
+    subprocess.run(["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", wav_path, path], check=True)
+    return path
+
+
+def synthetic_text(duration, seed=0):
+    """Sentences of filler text that would take about duration seconds to read."""
+    from text_to_speech import CHARS_PER_SECOND
+
+    rng = np.random.default_rng(seed)
+    sentences, length = [], 0
+    while length < duration * CHARS_PER_SECOND:
+        words = rng.choice(WORDS, size=int(rng.integers(6, 16)))
+        sentence = " ".join(words).capitalize() + "."
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)
+
+
+def percentiles(values):
+    """p50/p90/p99/max of a list of numbers (nearest rank), in seconds."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {"p50": rank(50), "p90": rank(90), "p99": rank(99), "max": ordered[-1]}
+
+
+def _timed(items):
+    """Consume an iterable, returning the seconds each item took to arrive after the previous one."""
+    latencies = []
+    last = time.perf_counter()
+    for _ in items:
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+    return latencies
+
+
+def run_stage(stage, options):
+    """Run one benchmark stage in this process and return its measurements.
+
+    Meant to run in a fresh process started with stage_environment(), so it
+    uses the stub backends and a cache of its own.
+    """
+    from config import ASR_SETTINGS, TRANSLATION_SETTINGS, TTS_SETTINGS
+    from audio_processor import convert_audio_format, get_audio_duration
+    from speech_recognition_module import iter_speech_chunks, transcribe_chunks
+    from translation_module import translate_passage
+    from text_to_speech import synthesize_segments
+    from concurrency import ordered_map
+    from pipeline import translate_audiobook
+
+    for settings in (ASR_SETTINGS, TRANSLATION_SETTINGS, TTS_SETTINGS):
+        settings["stub_latency"] = options["stub_latency"]
+    chunk_size = options["chunk_size"]
+
+    with open(options["audio_path"], "rb") as audio_file:
+        started = time.perf_counter()
+        wav_audio = convert_audio_format(audio_file)
+        converted = time.perf_counter()
+        duration = get_audio_duration(wav_audio)
+
+        if stage == "convert":
+            latencies = [converted - started]
+        else:
+            started = time.perf_counter()
+
+        if stage == "segment":
+            latencies = _timed(iter_speech_chunks(wav_audio, chunk_size))
+        elif stage == "transcribe":
+            latencies = _timed(transcribe_chunks(wav_audio, "en", chunk_size))
+        elif stage == "translate":
+            # One passage per chunk's worth of speech, as the pipeline sends them
+            passages = [synthetic_text(chunk_size, seed=n) for n in range(max(1, int(duration // chunk_size)))]
+            latencies = _timed(ordered_map(
+                lambda text: translate_passage(text, "en", "es"), passages, TRANSLATION_SETTINGS["max_workers"]
+            ))
+        elif stage == "synthesize":
+            latencies = _timed(synthesize_segments(synthetic_text(duration), "es"))
+        elif stage == "pipeline":
+            arrivals = []
+
+            def arrived(segment):
+                if segment is not None:
+                    arrivals.append(time.perf_counter())
+
+            with tempfile.TemporaryFile() as output:
+                translate_audiobook(wav_audio, "en", "es", chunk_size, output=output, on_segment=arrived)
+            latencies = [b - a for a, b in zip([started] + arrivals, arrivals)]
+        wall = time.perf_counter() - started
+
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return {
+        "audio_s": round(duration, 3),
+        "wall_s": round(wall, 4),
+        "throughput": round(duration / wall, 2) if wall else None,
+        "items": len(latencies),
+        "first_item_s": round(latencies[0], 4) if latencies else None,
+        "latency_s": {name: round(value, 4) for name, value in percentiles(latencies).items()},
+        "peak_rss_mb": round(peak_kb / 1024, 1)
+    }
+
+
+def stage_environment(workdir, name):
+    """Environment for a stage's process: stub backends, and a cache, job store and metrics directory of its own.
+
+    Keeping the metrics apart stops benchmark runs from adding to the real
+    Prometheus totals and event stream.
+    """
+    return {
+        "AUDIOBOOK_ASR_BACKEND": "stub",
+        "AUDIOBOOK_TRANSLATION_BACKEND": "stub",
+        "AUDIOBOOK_TTS_BACKEND": "stub",
+        "AUDIOBOOK_CACHE_DIR": os.path.join(workdir, name, "cache"),
+        "AUDIOBOOK_JOB_DIR": os.path.join(workdir, name, "jobs"),
+        "AUDIOBOOK_METRICS_DIR": os.path.join(workdir, name, "metrics")
+    }
+
+
+def measure_startup(workdir, repeat):
+    """Time a cold start of the app (import plus first render) in fresh interpreters; the fastest run is kept."""
+    env = dict(os.environ, **stage_environment(workdir, "startup"))
+    env["AUDIOBOOK_QUEUE_WORKERS"] = "0"  # Time the page, not starting worker processes
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-c", _STARTUP_SCRIPT, json.dumps(HEAVY_MODULES)], capture_output=True, text=True,
+            check=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run["import_s"] + run["render_s"])
+    return {
+        "import_s": round(best["import_s"], 4),
+        "render_s": round(best["render_s"], 4),
+        "first_render_s": round(best["import_s"] + best["render_s"], 4),
+        "heavy_modules": best["heavy_modules"],
+        "errors": best["errors"],
+        "runs": len(runs)
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a description of every stage that got slower or bigger than baseline by more than threshold."""
+    regressions = []
+    for stage, current in results["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous:
+            continue
+        slower = current["wall_s"] - previous["wall_s"] > NOISE_FLOOR_S
+        if slower and previous["throughput"] and current["throughput"] < previous["throughput"] * (1 - threshold):
+            regressions.append(f"{stage}: throughput {previous['throughput']} -> {current['throughput']} audio s/s")
+        p90, previous_p90 = current["latency_s"].get("p90"), previous["latency_s"].get("p90")
+        if p90 and previous_p90 and p90 > previous_p90 * (1 + threshold) and p90 - previous_p90 > NOISE_FLOOR_S:
+            regressions.append(f"{stage}: p90 latency {previous_p90}s -> {p90}s")
+        if current["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + threshold):
+            regressions.append(f"{stage}: peak RSS {previous['peak_rss_mb']} -> {current['peak_rss_mb']} MB")
+
+    startup, previous = results.get("startup"), baseline.get("startup")
+    if startup and previous:
+        current_s, previous_s = startup["first_render_s"], previous["first_render_s"]
+        if current_s > previous_s * (1 + threshold) and current_s - previous_s > NOISE_FLOOR_S:
+            regressions.append(f"startup: first render {previous_s}s -> {current_s}s")
+        for name in sorted(set(startup["heavy_modules"]) - set(previous["heavy_modules"])):
+            regressions.append(f"startup: {name} is now loaded before the first render")
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(args):
+    """Generate the audio fixture, run the selected stages each in a fresh process, and return the results."""
+    with tempfile.TemporaryDirectory(prefix="audiobook-bench-") as workdir:
+        wav_path = synthetic_speech(os.path.join(workdir, "speech.wav"), args.duration, args.sample_rate,
+                                    args.channels)
+        options = {
+            "workdir": workdir,
+            "audio_path": encode(wav_path, args.format),
+            "chunk_size": args.chunk_size,
+            "stub_latency": args.stub_latency
+        }
+        results = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "options": {key: getattr(args, key) for key in
+                        ("duration", "sample_rate", "channels", "format", "chunk_size", "stub_latency", "repeat")},
+            "stages": {}
+        }
+        context = multiprocessing.get_context("spawn")
+        for stage in args.stages:
+            runs = []
+            for attempt in range(args.repeat):
+                # Settings are read at import time, so they must be in place before the process starts
+                os.environ.update(stage_environment(workdir, f"{stage}-{attempt}"))
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    runs.append(pool.submit(run_stage, stage, options).result())
+            # The fastest run is the least disturbed by whatever else the machine was doing
+            best = max(runs, key=lambda run: run["throughput"] or 0)
+            results["stages"][stage] = dict(best, runs=len(runs),
+                                            peak_rss_mb=max(run["peak_rss_mb"] for run in runs))
+        if not args.skip_startup:
+            results["startup"] = measure_startup(workdir, args.repeat)
+    return results
+
+
+def print_report(results, regressions):
+    print(f"{'stage':<12}{'audio s/s':>11}{'wall s':>9}{'items':>7}{'p50 s':>9}{'p90 s':>9}{'p99 s':>9}{'RSS MB':>9}")
+    for stage, result in results["stages"].items():
+        latency = result["latency_s"]
+        print(f"{stage:<12}{result['throughput']:>11}{result['wall_s']:>9}{result['items']:>7}"
+              f"{latency.get('p50', ''):>9}{latency.get('p90', ''):>9}{latency.get('p99', ''):>9}"
+              f"{result['peak_rss_mb']:>9}")
+    startup = results.get("startup")
+    if startup:
+        print(f"startup: import {startup['import_s']}s + first render {startup['render_s']}s = "
+              f"{startup['first_render_s']}s; heavy modules loaded: {', '.join(startup['heavy_modules']) or 'none'}")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the processing stages offline with synthetic audio.")
+    parser.add_argument("--duration", type=float, default=BENCHMARK_SETTINGS["duration"],
+                        help="Seconds of synthetic speech")
+    parser.add_argument("--sample-rate", type=int, default=BENCHMARK_SETTINGS["sample_rate"])
+    parser.add_argument("--channels", type=int, choices=[1, 2], default=BENCHMARK_SETTINGS["channels"])
+    parser.add_argument("--format", choices=SUPPORTED_AUDIO_FORMATS, default=BENCHMARK_SETTINGS["format"],
+                        help="Container of the input audio (non-WAV needs FFmpeg)")
+    parser.add_argument("--chunk-size", type=int, default=AUDIO_SETTINGS["chunk_size_default"],
+                        help="Audio chunk size in seconds")
+    parser.add_argument("--stub-latency", type=float, default=BENCHMARK_SETTINGS["stub_latency"],
+                        help="Simulated seconds per request for the stub backends")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--skip-startup", action="store_true", help="Don't time the app's cold start")
+    parser.add_argument("--repeat", type=int, default=BENCHMARK_SETTINGS["repeat"],
+                        help="Runs per stage; the fastest is reported")
+    parser.add_argument("--output", help="Write the JSON results here")
+    parser.add_argument("--compare", help="JSON results of an earlier run to check for regressions")
+    parser.add_argument("--threshold", type=float, default=BENCHMARK_SETTINGS["regression_threshold"],
+                        help="Relative change flagged as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command-line entry point; returns the process exit status."""
+    args = parse_args(argv)
+    results = run_benchmarks(args)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline:
+            regressions = compare(results, json.load(baseline), args.threshold)
+        results["regressions"] = regressions
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    print_report(results, regressions)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,200 @@
+# cache_store.py
+"""Persistent on-disk caches for the Language Audiobook Translator."""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import metrics
+from config import CACHE_SETTINGS
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def normalize_text(text):
+    """Normalize text so trivially different copies of a segment share a cache key."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def make_key(*parts):
+    """Hash the parts of a cache key into a fixed-length hex digest."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ContentCache:
+    """A size-bounded, content-addressed key/value store in SQLite with LRU eviction.
+
+    Several processes (queue workers, batch workers, shard workers) can share
+    one cache file. The total size of the entries is kept in a one-row table
+    that every write updates in its own transaction, so the size limit holds
+    across all of them without summing the whole cache on each write.
+    """
+
+    def __init__(self, path, max_bytes, name=None):
+        self.path = path
+        self.name = name or os.path.splitext(os.path.basename(path))[0]
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL);"
+            # Sizes are read through these indexes, never from the rows behind the (large) values
+            "CREATE INDEX IF NOT EXISTS entries_accessed_size ON entries (accessed, size);"
+            "CREATE INDEX IF NOT EXISTS entries_key_size ON entries (key, size);"
+            "DROP INDEX IF EXISTS entries_accessed;"
+            "CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL);"
+            # Caches written before the totals table existed are summed once
+            "INSERT OR IGNORE INTO totals SELECT 0, COALESCE(SUM(size), 0) FROM entries;"
+        )
+        self._db.commit()
+
+    def get(self, key):
+        """Return the cached bytes for key, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                metrics.inc("audiobook_cache_lookups_total", cache=self.name, result="miss")
+                return None
+            self.hits += 1
+            metrics.inc("audiobook_cache_lookups_total", cache=self.name, result="hit")
+            self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def _write(self, work):
+        """Run work() in a write transaction, keeping the running total up to date.
+
+        work returns the change in bytes it made. IMMEDIATE takes the write
+        lock up front, so no other process writes between reading the total
+        and evicting.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                change = work()
+                if change:
+                    total = self._db.execute(
+                        "UPDATE totals SET bytes = bytes + ? WHERE id = 0 RETURNING bytes", (change,)
+                    ).fetchone()[0]
+                    if total > self.max_bytes:
+                        self._evict(total)
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+
+    def _size(self, key):
+        row = self._db.execute("SELECT size FROM entries INDEXED BY entries_key_size WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def put(self, key, value):
+        """Store bytes under key, evicting least recently used entries if over the size limit."""
+        size = len(value)
+        if size > self.max_bytes:
+            return
+
+        def insert():
+            old = self._size(key)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            return size - old
+
+        self._write(insert)
+
+    def get_text(self, key):
+        """Return the cached string for key, or None."""
+        value = self.get(key)
+        return None if value is None else value.decode("utf-8")
+
+    def put_text(self, key, text):
+        """Store a string under key."""
+        self.put(key, text.encode("utf-8"))
+
+    def delete(self, key):
+        """Remove key from the cache."""
+
+        def remove():
+            old = self._size(key)
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return -old
+
+        self._write(remove)
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._db.execute("UPDATE totals SET bytes = 0 WHERE id = 0")
+            self._db.commit()
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache."""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            total = self._db.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes
+        }
+
+    def _evict(self, total):
+        """Drop least recently used entries until the cache fits in max_bytes (inside the write transaction)."""
+        victims = []
+        for rowid, size in self._db.execute("SELECT rowid, size FROM entries ORDER BY accessed, size"):
+            if total <= self.max_bytes:
+                break
+            victims.append((rowid,))
+            total -= size
+        self._db.executemany("DELETE FROM entries WHERE rowid = ?", victims)
+        self._db.execute("UPDATE totals SET bytes = ? WHERE id = 0", (total,))
+
+def open_cache(name):
+    """Return the process-wide cache called name, opening it on first use."""
+    with _caches_lock:
+        if name not in _caches:
+            path = os.path.join(CACHE_SETTINGS["directory"], f"{name}.sqlite3")
+            _caches[name] = ContentCache(path, CACHE_SETTINGS["max_bytes"][name], name)
+        return _caches[name]
+
+
+def translation_key(text, source_lang, target_lang, backend):
+    """Cache key for one translated segment."""
+    return make_key("translation", normalize_text(text), source_lang, target_lang, backend)
+
+
+def transcription_key(audio, source_lang, backend, settings):
+    """Cache key for the transcript of one chunk of audio (a speech_recognition AudioData).
+
+    settings holds the recognizer's model and language settings (its settings()).
+    """
+    return make_key(
+        "transcription", audio.frame_data, str(audio.sample_rate), str(audio.sample_width),
+        source_lang, backend, settings
+    )
+
+
+def speech_key(text, lang, voice, backend):
+    """Cache key for the synthesized MP3 of one piece of text; voice holds the settings that change the sound."""
+    return make_key("tts", normalize_text(text), lang, voice, backend)
\ No newline at end of file
@@ -0,0 +1,219 @@
+# cli.py
+"""Headless command-line batch runner for the Language Audiobook Translator.
+
+Runs the same convert -> transcribe -> translate -> synthesize chain as the
+Streamlit app over a set of files, several files at a time, and writes the
+results as JSON:
+
+    python cli.py books/ --source en --target es --output-dir out --jobs 4
+    python cli.py --manifest titles.json --results results.json
+
+Exit status is 0 when every file succeeded, 1 when any failed and 2 for
+invalid arguments.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from config import (
+    LANGUAGES, AUDIO_SETTINGS, ASR_SETTINGS, TRANSLATION_SETTINGS, TTS_SETTINGS, SUPPORTED_AUDIO_FORMATS,
+    BATCH_SETTINGS
+)
+from recognizer_backends import RECOGNIZER_BACKENDS
+from translation_module import TRANSLATION_BACKENDS
+from text_to_speech import TTS_BACKENDS
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+def language_code(value):
+    """Accept either a language name from LANGUAGES or one of its codes."""
+    if value in LANGUAGES:
+        return LANGUAGES[value]
+    if value.lower() in LANGUAGES.values():
+        return value.lower()
+    raise argparse.ArgumentTypeError(f"unknown language: {value}")
+
+
+def find_audio_files(path):
+    """Return the supported audio files at path, searching directories recursively."""
+    if os.path.isfile(path):
+        return [path]
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"no such file or directory: {path}")
+    found = []
+    for root, _, names in os.walk(path):
+        for name in sorted(names):
+            if name.rsplit('.', 1)[-1].lower() in SUPPORTED_AUDIO_FORMATS:
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def load_manifest(path):
+    """Read a manifest: a JSON list of paths or {"path", "source", "target"} objects, or one path per line."""
+    with open(path, encoding="utf-8") as manifest:
+        content = manifest.read()
+    if path.lower().endswith(".json"):
+        entries = json.loads(content)
+    else:
+        entries = [line.strip() for line in content.splitlines() if line.strip() and not line.startswith("#")]
+    return [entry if isinstance(entry, dict) else {"path": entry} for entry in entries]
+
+
+def build_tasks(args):
+    """Turn the command-line arguments into one task dict per input file."""
+    entries = [{"path": path} for path in args.inputs]
+    if args.manifest:
+        entries.extend(load_manifest(args.manifest))
+
+    tasks = []
+    bases = set()
+    for entry in entries:
+        root = entry["path"] if os.path.isdir(entry["path"]) else os.path.dirname(entry["path"])
+        for path in find_audio_files(entry["path"]):
+            target = language_code(entry.get("target", args.target))
+            # Mirror the input's place under its directory, so 01.wav in two folders don't overwrite each other
+            stem = os.path.splitext(os.path.relpath(path, root or "."))[0]
+            base = os.path.join(args.output_dir, f"{stem}.{target}")
+            suffix = 2
+            while base in bases:
+                base = os.path.join(args.output_dir, f"{stem}-{suffix}.{target}")
+                suffix += 1
+            bases.add(base)
+            tasks.append({
+                "path": path,
+                "source": language_code(entry.get("source", args.source)),
+                "target": target,
+                "chunk_size": entry.get("chunk_size", args.chunk_size),
+                "asr_backend": entry.get("asr_backend", args.asr_backend),
+                "translation_backend": entry.get("translation_backend", args.translation_backend),
+                "tts_backend": entry.get("tts_backend", args.tts_backend),
+                "output_base": base
+            })
+    return tasks
+
+
+def process_file(task):
+    """Process one audiobook file and return a JSON-serializable result; never raises."""
+    # Imported here so each worker process loads the heavy backends itself
+    from audio_processor import convert_audio_format, get_audio_duration
+    from pipeline import translate_audiobook
+    from job_store import open_job_store, job_id_for
+    from http_client import connection_stats
+    from metrics import span, flush
+
+    started = time.time()
+    http_before = connection_stats()
+    base = task["output_base"]
+    result = {"input": task["path"], "source": task["source"], "target": task["target"]}
+
+    try:
+        with open(task["path"], "rb") as audio_file:
+            # Re-running the same file and settings resumes its job from the last finished segment
+            job_id = job_id_for(
+                audio_file, task["source"], task["target"], task["chunk_size"], task["asr_backend"],
+                task["translation_backend"], task["tts_backend"]
+            )
+            open_job_store().create_job(job_id, task["path"], task["source"], task["target"], task["chunk_size"])
+            result["job_id"] = job_id
+
+            with span("decode", job=job_id) as record:
+                record["bytes_in"] = os.path.getsize(task["path"])
+                wav_audio = convert_audio_format(audio_file)
+            duration = get_audio_duration(wav_audio)
+            os.makedirs(os.path.dirname(base) or ".", exist_ok=True)
+            with open(base + ".mp3", "wb") as output:
+                segments, _ = translate_audiobook(
+                    wav_audio, task["source"], task["target"], task["chunk_size"], output=output,
+                    job_id=job_id, asr_backend=task["asr_backend"],
+                    translation_backend=task["translation_backend"], tts_backend=task["tts_backend"]
+                )
+
+        with open(base + ".json", "w", encoding="utf-8") as transcript:
+            json.dump({"source": task["source"], "target": task["target"], "segments": segments},
+                      transcript, ensure_ascii=False, indent=2)
+
+        result.update({
+            "status": "ok",
+            "audio": base + ".mp3",
+            "transcript": base + ".json",
+            "duration_s": round(duration, 2),
+            "segments": len(segments)
+        })
+    except Exception as e:
+        result.update({"status": "error", "error_type": type(e).__name__, "error": str(e)})
+
+    # Connection reuse for this file alone (the pool outlives it within a worker process)
+    http_after = connection_stats()
+    result["http_requests"] = http_after["requests"] - http_before["requests"]
+    result["http_connections"] = http_after["connections"] - http_before["connections"]
+    result["elapsed_s"] = round(time.time() - started, 2)
+    flush(force=True)
+    return result
+
+
+def run_batch(tasks, jobs):
+    """Process the tasks on a pool of jobs worker processes, returning results in task order."""
+    if jobs <= 1:
+        return [process_file(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(process_file, tasks))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Translate audiobooks without the Streamlit UI.")
+    parser.add_argument("inputs", nargs="*", help="Audio files or directories to process")
+    parser.add_argument("--manifest", help="JSON list or text file of inputs (with optional per-file languages)")
+    parser.add_argument("--source", type=language_code, default="en", help="Source language name or code")
+    parser.add_argument("--target", type=language_code, default="es", help="Target language name or code")
+    parser.add_argument("--chunk-size", type=int, default=AUDIO_SETTINGS["chunk_size_default"],
+                        help="Audio chunk size in seconds")
+    parser.add_argument("--asr-backend", choices=sorted(RECOGNIZER_BACKENDS), default=ASR_SETTINGS["backend"],
+                        help="Speech recognizer to use")
+    parser.add_argument("--translation-backend", choices=["auto"] + sorted(TRANSLATION_BACKENDS),
+                        default=TRANSLATION_SETTINGS["backend"], help="Translation service to use")
+    parser.add_argument("--tts-backend", choices=sorted(TTS_BACKENDS), default=TTS_SETTINGS["backend"],
+                        help="Text-to-speech service to use")
+    parser.add_argument("--output-dir", default=BATCH_SETTINGS["output_dir"], help="Where to write results")
+    parser.add_argument("--jobs", type=int, default=BATCH_SETTINGS["jobs"], help="Files processed in parallel")
+    parser.add_argument("--results", help="Write the JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command-line entry point; returns the process exit status."""
+    try:
+        args = parse_args(argv)
+        tasks = build_tasks(args)
+    except SystemExit as e:
+        return e.code
+    except (OSError, ValueError, argparse.ArgumentTypeError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if not tasks:
+        print("error: no audio files to process", file=sys.stderr)
+        return EXIT_USAGE
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    results = run_batch(tasks, args.jobs)
+    failed = sum(1 for result in results if result["status"] != "ok")
+    report = json.dumps({"succeeded": len(results) - failed, "failed": failed, "results": results},
+                        ensure_ascii=False, indent=2)
+
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as results_file:
+            results_file.write(report)
+    else:
+        print(report)
+
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
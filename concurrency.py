@@ -0,0 +1,367 @@
+# concurrency.py
+"""Concurrency helpers shared by the processing stages of the Language Audiobook Translator."""
+
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from config import SCHEDULER_SETTINGS, JOB_SETTINGS
+from errors import RateLimitedError
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _rate_limit_error(error):
+    """Return the RateLimitedError behind error (it may be wrapped by a library exception), or None."""
+    while error is not None:
+        if isinstance(error, RateLimitedError):
+            return error
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def retry_delay(error, attempt, backoff):
+    """Seconds to wait before retry number attempt + 1 after error.
+
+    Honors the wait a throttling service asked for; otherwise backs off
+    exponentially, with jitter so that parallel callers don't all retry at
+    the same moment.
+    """
+    throttled = _rate_limit_error(error)
+    if throttled is not None and throttled.retry_after is not None:
+        return min(throttled.retry_after, SCHEDULER_SETTINGS["backoff_cap"])
+    delay = min(backoff * (2 ** attempt), SCHEDULER_SETTINGS["backoff_cap"])
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second, up to `burst` at once."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Take a token if one is available; otherwise return the seconds until the next one."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def adjust_rate(self, change):
+        """Add tokens at change(current rate) per second from now on."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.rate = change(self.rate)
+
+    def acquire(self):
+        """Wait for a token and take it."""
+        wait = self.take()
+        while wait:
+            time.sleep(wait)
+            wait = self.take()
+
+
+class SharedTokenBucket(TokenBucket):
+    """A token bucket kept in SQLite, shared by every process that opens the same file.
+
+    Each worker process has its own limiters, so with a bucket per process
+    N workers would call a backend N times as fast as its rate limit. Here
+    the tokens and the rate live in one row per backend, updated in a write
+    transaction, so the limit holds for all of them together - and a backend
+    that throttles one worker slows every worker down. `rate` is the shared
+    rate as of this process's last take() or adjust_rate().
+    """
+
+    def __init__(self, path, name, rate, burst=1):
+        self.path = path
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Autocommit mode: the transactions are begun explicitly
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " name TEXT PRIMARY KEY, rate REAL NOT NULL, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        # A bucket left idle since an earlier run starts over at the configured rate
+        now = time.time()
+        self._db.execute(
+            "INSERT INTO buckets VALUES (?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET"
+            " rate = excluded.rate, tokens = excluded.tokens, updated = excluded.updated"
+            " WHERE buckets.updated < ?",
+            (name, rate, burst, now, now - SCHEDULER_SETTINGS["backoff_cap"])
+        )
+
+    def _update(self, take=False, change=None):
+        """Refill the shared bucket up to now, then take a token from it or change its rate.
+
+        Returns the seconds until a token is available, if one was wanted but there was none.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rate, tokens, updated = self._db.execute(
+                    "SELECT rate, tokens, updated FROM buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                now = time.time()
+                tokens = min(self.burst, tokens + max(now - updated, 0.0) * rate)
+                wait = 0.0
+                if change is not None:
+                    rate = change(rate)
+                if take:
+                    if tokens >= 1:
+                        tokens -= 1
+                    else:
+                        wait = (1 - tokens) / rate
+                self._db.execute(
+                    "UPDATE buckets SET rate = ?, tokens = ?, updated = ? WHERE name = ?",
+                    (rate, tokens, now, self.name)
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self.rate = rate
+        return wait
+
+    def take(self):
+        """Take a token if one is available; otherwise return the seconds until the next one."""
+        return self._update(take=True)
+
+    def adjust_rate(self, change):
+        """Add tokens at change(current rate) per second from now on, for every process."""
+        self._update(change=change)
+
+
+class AdaptiveLimiter:
+    """Rate limit and adaptive concurrency for the calls to one external backend.
+
+    Calls wait for a token from the backend's token bucket (if it has a rate
+    limit) and for a free slot in its concurrency window. Both follow AIMD,
+    like TCP congestion control. The window grows by about one slot per
+    window's worth of successful calls, and shrinks by a factor whenever the
+    backend throttles us (HTTP 429) or a call takes much longer than usual.
+    A throttling backend also has its request rate cut by the same factor
+    (one without a configured rate is paced from then on, starting from the
+    rate it was being called at), and the rate creeps back up to the
+    configured one while calls succeed.
+    """
+
+    def __init__(self, name, rate=None, burst=1):
+        self.name = name
+        self.max_rate = rate
+        self.bucket = self._new_bucket(rate, burst) if rate else None
+        self.limit = float(SCHEDULER_SETTINGS["initial_concurrency"])
+        self.in_flight = 0
+        self.latency = None  # Moving average of successful call durations
+        self.paused_until = 0.0
+        self.started = deque(maxlen=64)  # When recent calls started, to measure the unpaced rate
+        self._cond = threading.Condition()
+
+    def _acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            self.started.append(time.monotonic())
+        # A throttling backend gets a break from every caller, not just the one that was told off
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+        if self.bucket:
+            self.bucket.acquire()
+
+    def _release(self, elapsed=None, throttled=None):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled is not None:
+                metrics.inc("audiobook_backend_calls_total", backend=self.name, outcome="throttled")
+                self._decrease()
+                self._slow_down()
+                if throttled.retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + throttled.retry_after)
+            elif elapsed is not None:
+                if self._is_slow(elapsed):
+                    self._decrease()
+                else:
+                    self.limit = min(self.limit + 1 / self.limit, SCHEDULER_SETTINGS["max_concurrency"])
+                    self._speed_up()
+                self.latency = elapsed if self.latency is None else 0.9 * self.latency + 0.1 * elapsed
+                metrics.inc("audiobook_backend_calls_total", backend=self.name, outcome="ok")
+                metrics.observe("audiobook_backend_call_seconds", elapsed, backend=self.name)
+            else:
+                metrics.inc("audiobook_backend_calls_total", backend=self.name, outcome="failed")
+            metrics.set_gauge("audiobook_backend_concurrency", round(self.limit, 2), backend=self.name)
+            if self.bucket:
+                metrics.set_gauge("audiobook_backend_rate", round(self.bucket.rate, 2), backend=self.name)
+            self._cond.notify_all()
+
+    def _is_slow(self, elapsed):
+        """A call much slower than usual, in proportion and in seconds, is a sign of congestion."""
+        return (self.latency is not None and elapsed > self.latency * SCHEDULER_SETTINGS["slow_factor"]
+                and elapsed - self.latency > SCHEDULER_SETTINGS["slow_min_s"])
+
+    def _decrease(self):
+        self.limit = max(self.limit * SCHEDULER_SETTINGS["decrease_factor"], SCHEDULER_SETTINGS["min_concurrency"])
+
+    def _call_rate(self):
+        """Calls per second over the recent calls."""
+        if len(self.started) < 2 or self.started[-1] <= self.started[0]:
+            return float(SCHEDULER_SETTINGS["initial_concurrency"])
+        return (len(self.started) - 1) / (self.started[-1] - self.started[0])
+
+    def _new_bucket(self, rate, burst=1):
+        if not SCHEDULER_SETTINGS["shared_limits"]:
+            return TokenBucket(rate, burst)
+        # Next to the job store, which every worker on this machine opens
+        path = os.path.join(JOB_SETTINGS["directory"], "rate_limits.sqlite3")
+        return SharedTokenBucket(path, self.name, rate, burst)
+
+    def _slow_down(self):
+        def slower(rate):
+            return max(rate * SCHEDULER_SETTINGS["decrease_factor"], SCHEDULER_SETTINGS["min_rate"])
+
+        if self.bucket is None:
+            self.bucket = self._new_bucket(slower(self._call_rate()))
+        else:
+            self.bucket.adjust_rate(slower)
+
+    def _speed_up(self):
+        if self.bucket is None:
+            return
+
+        def faster(rate):
+            # Regain rate_increase requests per second for each second's worth of successful calls
+            rate += SCHEDULER_SETTINGS["rate_increase"] / rate
+            return min(rate, self.max_rate) if self.max_rate else rate
+
+        self.bucket.adjust_rate(faster)
+
+    def _attempt(self, func, *args):
+        self._acquire()
+        started = time.monotonic()
+        try:
+            result = func(*args)
+        except Exception as e:
+            self._release(throttled=_rate_limit_error(e))
+            raise
+        self._release(elapsed=time.monotonic() - started)
+        return result
+
+    def call(self, func, *args, retries=3, backoff=1.0, retry_on=(Exception,)):
+        """Call func(*args) within the backend's limits, retrying with jittered exponential backoff.
+
+        Up to `retries` retries follow failures of the kinds in retry_on. Being
+        throttled doesn't use them up: the limiter slows down instead, and
+        the call is retried up to SCHEDULER_SETTINGS["throttled_retries"]
+        more times.
+        """
+        attempt = throttled = 0
+        while True:
+            try:
+                return self._attempt(func, *args)
+            except retry_on as e:
+                if _rate_limit_error(e) is not None and throttled < SCHEDULER_SETTINGS["throttled_retries"]:
+                    throttled += 1
+                    # The slower pace does the backing off; just wait out what the service asked for
+                    delay = retry_delay(e, 0, backoff)
+                elif attempt < retries:
+                    delay = retry_delay(e, attempt, backoff)
+                    attempt += 1
+                else:
+                    raise
+                metrics.inc("audiobook_backend_retries_total", backend=self.name)
+                time.sleep(delay)
+
+
+def get_limiter(name):
+    """Return the process-wide limiter for a backend, e.g. "asr.google" or "tts.gtts".
+
+    Rate limits come from SCHEDULER_SETTINGS["rate_limits"]; every call to an
+    external service goes through its backend's limiter. The rates are
+    shared by all the processes on the machine (see SharedTokenBucket)
+    unless SCHEDULER_SETTINGS["shared_limits"] is off; the concurrency
+    windows are per process.
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            rate, burst = SCHEDULER_SETTINGS["rate_limits"].get(name, (None, 1))
+            _limiters[name] = AdaptiveLimiter(name, rate, burst)
+        return _limiters[name]
+
+
+def ordered_map(func, items, max_workers, window=None):
+    """Run func over items on a bounded thread pool, yielding results in input order.
+
+    At most `window` items (default: twice the pool size) are in flight at once,
+    so items are pulled from the iterable lazily and memory stays bounded even
+    for very long inputs.
+    """
+    if max_workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    window = window or max_workers * 2
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Don't keep working on chunks nobody will read (error or early close)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def worker_name():
+    """Name of this process in the job and shard claims: host and process ID."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def poll_work(claim, run, poll_interval, stop=None):
+    """Do claimed work one piece after another until stop (a multiprocessing.Event) is set.
+
+    claim() returns the next piece of work, or something false when there
+    is none, in which case it is asked again after poll_interval seconds;
+    run(work) does it.
+    """
+    while stop is None or not stop.is_set():
+        work = claim()
+        if not work:
+            time.sleep(poll_interval)
+            continue
+        run(work)
+
+
+def start_processes(target, count, name):
+    """Start count daemon processes running target() and return them, named name-0, name-1..."""
+    # Spawned rather than forked: the app process has threads and open connections
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=target, daemon=True, name=f"{name}-{n}") for n in range(count)]
+    for process in processes:
+        process.start()
+    return processes
\ No newline at end of file
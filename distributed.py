@@ -0,0 +1,448 @@
+# distributed.py
+"""Distributed processing of one long audiobook for the Language Audiobook Translator.
+
+The job queue (job_queue.py) spreads books over the worker processes of one
+machine. Here a single book is spread over several machines: the
+coordinator converts it, splits it into time-range shards cut in pauses
+between sentences, and puts them in a work queue on storage every node can
+reach (SHARD_SETTINGS["directory"]). Worker nodes transcribe, translate
+and synthesize whole shards, and the coordinator joins their transcripts
+and MP3s back together in order:
+
+    python distributed.py work --workers 4      # on every worker node
+    python distributed.py coordinate book.mp3 --source en --target es --output book.es.mp3
+
+The queue is plain files, because the job store's SQLite database can't
+be shared between hosts. Each shard is claimed by renaming its entry from
+queued/ to claimed/, which only one worker can win, and a worker touches
+its claim after every segment. Claims left untouched for
+SHARD_SETTINGS["stale_after"] seconds are handed out again, and a shard
+that fails is retried up to SHARD_SETTINGS["attempts"] times.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+import time
+import wave
+from config import SHARD_SETTINGS, AUDIO_SETTINGS
+from audio_processor import convert_audio_format, get_audio_duration
+from segmentation import segment_speech
+from pipeline import translate_audiobook
+from job_store import job_id_for, resolve_backends
+from errors import ShardFailedError
+from metrics import span, inc, emit, flush
+from concurrency import worker_name, poll_work, start_processes
+
+# Frames copied at a time when cutting shards out of the book
+_COPY_FRAMES = 1024 * 1024
+
+
+def plan_shards(wav_audio, shard_seconds):
+    """Return [(start, end), ...] shards of about shard_seconds covering the WAV audio.
+
+    Every cut is made in the middle of the first pause between speech
+    segments once a shard has reached shard_seconds, so no sentence is
+    split between two shards. A shard only grows longer than that when
+    there is no pause to cut in.
+    """
+    duration = get_audio_duration(wav_audio)
+    segments = segment_speech(wav_audio)
+    cuts = [0.0]
+    for previous, segment in zip(segments, segments[1:]):
+        # Pieces of one long run of speech touch; only a real gap is a pause
+        if segment.start > previous.end and segment.start - cuts[-1] >= shard_seconds:
+            cuts.append((previous.end + segment.start) / 2)
+    cuts.append(duration)
+    return [(start, end) for start, end in zip(cuts, cuts[1:]) if end > start]
+
+
+def write_shards(wav_audio, bounds, path_for):
+    """Copy each (start, end) range of the WAV audio into its own WAV file at path_for(number)."""
+    wav_audio.seek(0)
+    with wave.open(wav_audio, "rb") as book:
+        rate = book.getframerate()
+        for number, (start, end) in enumerate(bounds):
+            first, last = int(round(start * rate)), min(int(round(end * rate)), book.getnframes())
+            path = path_for(number)
+            with wave.open(path + ".tmp", "wb") as shard:
+                shard.setparams(book.getparams())
+                book.setpos(first)
+                for position in range(first, last, _COPY_FRAMES):
+                    shard.writeframes(book.readframes(min(_COPY_FRAMES, last - position)))
+            os.replace(path + ".tmp", path)
+    wav_audio.seek(0)
+
+
+class ShardQueue:
+    """The shared directory holding every distributed book: its shards, their claims and their results.
+
+    Per book (named by its job ID, see job_store.job_id_for()):
+
+        book.json               settings and shard bounds
+        shard-0000.wav          the shard's audio
+        queued/shard-0000.json  waiting for a worker
+        claimed/shard-0000.json being worked on (touched as the work goes on)
+        failed/shard-0000.json  failed on every attempt, with the error
+        shard-0000.mp3 / .json  the result: speech, and segments timed from the start of the book
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def book_dir(self, book_id):
+        return os.path.join(self.directory, book_id)
+
+    def shard_path(self, book_id, number, extension):
+        """Path of a shard's audio (.wav), synthesized speech (.mp3) or segments (.json)."""
+        return os.path.join(self.book_dir(book_id), f"shard-{number:04d}{extension}")
+
+    def entry_path(self, book_id, state, number):
+        """Path of a shard's queue entry in state 'queued', 'claimed' or 'failed'."""
+        return os.path.join(self.book_dir(book_id), state, f"shard-{number:04d}.json")
+
+    def load_book(self, book_id):
+        """Return the book's settings and shards, or None if it hasn't been submitted."""
+        try:
+            with open(os.path.join(self.book_dir(book_id), "book.json"), encoding="utf-8") as book:
+                return json.load(book)
+        except FileNotFoundError:
+            return None
+
+    def _write_json(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so other nodes never read a half-written file
+        with open(path + ".tmp", "w", encoding="utf-8") as json_file:
+            json.dump(data, json_file, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def _read_json(self, path):
+        try:
+            with open(path, encoding="utf-8") as json_file:
+                return json.load(json_file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _entries(self, book_id, state):
+        directory = os.path.join(self.book_dir(book_id), state)
+        names = os.listdir(directory) if os.path.isdir(directory) else []
+        return sorted(int(name[6:10]) for name in names if name.startswith("shard-") and name.endswith(".json"))
+
+    def is_done(self, book_id, number):
+        return os.path.exists(self.shard_path(book_id, number, ".json"))
+
+    def create_book(self, book_id, book, wav_audio):
+        """Cut the converted audio into the book's shards and queue them all."""
+        os.makedirs(self.book_dir(book_id), exist_ok=True)
+        write_shards(wav_audio, [(shard["start"], shard["end"]) for shard in book["shards"]],
+                     lambda number: self.shard_path(book_id, number, ".wav"))
+        self._write_json(os.path.join(self.book_dir(book_id), "book.json"), book)
+        for shard in book["shards"]:
+            self.queue_shard(book_id, shard["number"])
+
+    def queue_shard(self, book_id, number, attempts=0):
+        self._write_json(self.entry_path(book_id, "queued", number),
+                         {"book": book_id, "shard": number, "attempts": attempts})
+
+    def requeue_missing(self, book_id):
+        """Queue again every shard of a resubmitted book that has no result and isn't queued or claimed."""
+        book = self.load_book(book_id)
+        active = set(self._entries(book_id, "queued")) | set(self._entries(book_id, "claimed"))
+        for shard in book["shards"]:
+            number = shard["number"]
+            if number not in active and not self.is_done(book_id, number):
+                self.queue_shard(book_id, number)
+                try:
+                    os.remove(self.entry_path(book_id, "failed", number))
+                except FileNotFoundError:
+                    pass
+
+    def requeue_stale(self, book_id, stale_after):
+        """Hand out again the shards whose worker hasn't made progress for stale_after seconds."""
+        for number in self._entries(book_id, "claimed"):
+            claim = self.entry_path(book_id, "claimed", number)
+            try:
+                if time.time() - os.path.getmtime(claim) > stale_after:
+                    os.rename(claim, self.entry_path(book_id, "queued", number))
+            except FileNotFoundError:
+                # Finished, or requeued by another worker, in the meantime
+                continue
+
+    def claim_shard(self, stale_after):
+        """Claim the next queued shard of the oldest book and return (book ID, entry, claim path), or None."""
+        books = [name for name in os.listdir(self.directory)
+                 if os.path.isdir(self.book_dir(name)) and self.load_book(name)]
+        books.sort(key=lambda name: os.path.getmtime(os.path.join(self.book_dir(name), "book.json")))
+        for book_id in books:
+            self.requeue_stale(book_id, stale_after)
+            for number in self._entries(book_id, "queued"):
+                queued, claim = self.entry_path(book_id, "queued", number), self.entry_path(book_id, "claimed", number)
+                os.makedirs(os.path.dirname(claim), exist_ok=True)
+                try:
+                    # Touched first: a rename keeps the old time, which would look stale to other workers
+                    os.utime(queued)
+                    # Only one worker's rename can succeed; the others find the entry gone
+                    os.rename(queued, claim)
+                except FileNotFoundError:
+                    continue
+                entry = self._read_json(claim)
+                if entry is not None:
+                    return book_id, entry, claim
+        return None
+
+    def finish_shard(self, book_id, number, segments, speech_path, claim):
+        """Store a shard's result (its speech is already written to speech_path) and release the claim."""
+        os.replace(speech_path, self.shard_path(book_id, number, ".mp3"))
+        # The segments are written last: their file marks the shard as done
+        self._write_json(self.shard_path(book_id, number, ".json"), {"shard": number, "segments": segments})
+        try:
+            os.remove(claim)
+        except FileNotFoundError:
+            pass
+
+    def fail_shard(self, book_id, entry, claim, error):
+        """Queue a failed shard again, or record it as failed once it has used up its attempts."""
+        number, attempts = entry["shard"], entry["attempts"] + 1
+        if attempts < SHARD_SETTINGS["attempts"]:
+            self.queue_shard(book_id, number, attempts)
+        else:
+            self._write_json(self.entry_path(book_id, "failed", number),
+                             dict(entry, attempts=attempts, error=str(error), error_type=type(error).__name__))
+        try:
+            os.remove(claim)
+        except FileNotFoundError:
+            pass
+
+    def progress(self, book_id):
+        """Return how many of the book's shards are completed, queued and running, and the failed ones."""
+        book = self.load_book(book_id)
+        if book is None:
+            return None
+        return {
+            "shards": len(book["shards"]),
+            "completed": sum(1 for shard in book["shards"] if self.is_done(book_id, shard["number"])),
+            "queued": len(self._entries(book_id, "queued")),
+            "running": len(self._entries(book_id, "claimed")),
+            "failed": [self._read_json(self.entry_path(book_id, "failed", number))
+                       for number in self._entries(book_id, "failed")]
+        }
+
+
+def open_shard_queue():
+    """Return the shard queue in SHARD_SETTINGS["directory"]."""
+    return ShardQueue(SHARD_SETTINGS["directory"])
+
+
+def submit_book(audio_file, name, source_lang, target_lang, chunk_size, asr_backend=None,
+                translation_backend=None, tts_backend=None, shard_seconds=None):
+    """Split the audiobook into shards, queue them for the worker nodes and return the book's ID.
+
+    The same file and settings always give the same book, so submitting it
+    again doesn't redo the shards that are finished or being worked on; only
+    missing and failed ones are queued again.
+    """
+    queue = open_shard_queue()
+    backends = resolve_backends(asr_backend, translation_backend, tts_backend)
+    shard_seconds = shard_seconds or SHARD_SETTINGS["shard_seconds"]
+    book_id = job_id_for(audio_file, source_lang, target_lang, chunk_size, **backends,
+                         variant=f"shard_seconds={shard_seconds}")
+    if queue.load_book(book_id):
+        queue.requeue_missing(book_id)
+        return book_id
+
+    with span("decode", book=book_id) as record:
+        audio_file.seek(0, os.SEEK_END)
+        record["bytes_in"] = audio_file.tell()
+        audio_file.seek(0)
+        wav_audio = convert_audio_format(audio_file)
+    with span("shard", book=book_id) as record:
+        bounds = plan_shards(wav_audio, shard_seconds)
+        record["shards"] = len(bounds)
+        book = {
+            "name": name, "source": source_lang, "target": target_lang, "chunk_size": chunk_size,
+            **backends,
+            "duration": get_audio_duration(wav_audio),
+            "shards": [{"number": number, "start": start, "end": end} for number, (start, end) in enumerate(bounds)]
+        }
+        queue.create_book(book_id, book, wav_audio)
+    emit("book", book=book_id, status="queued", shards=len(bounds))
+    return book_id
+
+
+def run_shard(queue, book_id, entry, claim, worker):
+    """Transcribe, translate and synthesize one claimed shard, storing its result; failures are recorded."""
+    book = queue.load_book(book_id)
+    number = entry["shard"]
+    offset = book["shards"][number]["start"]
+    speech_path = queue.shard_path(book_id, number, f".{socket.gethostname()}-{os.getpid()}.mp3")
+
+    def heartbeat(segment):
+        try:
+            os.utime(claim)
+        except FileNotFoundError:
+            # Handed to another worker meanwhile; whichever finishes first stores the result
+            pass
+
+    try:
+        with span("shard_run", book=book_id, shard=number, worker=worker) as record:
+            with open(queue.shard_path(book_id, number, ".wav"), "rb") as audio_file, \
+                    open(speech_path, "wb") as output:
+                record["bytes_in"] = os.path.getsize(audio_file.name)
+                segments, _ = translate_audiobook(
+                    convert_audio_format(audio_file), book["source"], book["target"], book["chunk_size"],
+                    output=output, on_segment=heartbeat, asr_backend=book["asr_backend"],
+                    translation_backend=book["translation_backend"], tts_backend=book["tts_backend"]
+                )
+            record["bytes_out"] = os.path.getsize(speech_path)
+        # Times from the start of the book rather than of the shard
+        for segment in segments:
+            segment["start"] += offset
+            segment["end"] += offset
+        queue.finish_shard(book_id, number, segments, speech_path, claim)
+        inc("audiobook_shards_total", status="completed")
+        emit("shard", book=book_id, shard=number, status="completed", worker=worker)
+    except Exception as e:
+        if os.path.exists(speech_path):
+            os.remove(speech_path)
+        queue.fail_shard(book_id, entry, claim, e)
+        inc("audiobook_shards_total", status="failed")
+        emit("shard", book=book_id, shard=number, status="failed", worker=worker, error_type=type(e).__name__)
+    flush(force=True)
+
+
+def worker_loop(stop=None):
+    """Run queued shards one after another until stop (a multiprocessing.Event) is set."""
+    queue = open_shard_queue()
+    worker = worker_name()
+    poll_work(lambda: queue.claim_shard(SHARD_SETTINGS["stale_after"]),
+              lambda claimed: run_shard(queue, *claimed, worker),
+              SHARD_SETTINGS["poll_interval"], stop)
+
+
+def start_workers(count):
+    """Start count worker processes on this machine and return them."""
+    return start_processes(worker_loop, count, "audiobook-shard-worker")
+
+
+def wait_for_book(book_id, on_progress=None):
+    """Block until every shard of the book is done, calling on_progress with its progress on every check.
+
+    Raises ShardFailedError as soon as a shard has failed on every attempt.
+    """
+    queue = open_shard_queue()
+    while True:
+        progress = queue.progress(book_id)
+        if on_progress:
+            on_progress(progress)
+        if progress["failed"]:
+            failed = progress["failed"][0]
+            raise ShardFailedError(
+                f"Shard {failed['shard']} of book {book_id} failed {failed['attempts']} times: "
+                f"{failed['error_type']}: {failed['error']}"
+            )
+        if progress["completed"] == progress["shards"]:
+            return progress
+        time.sleep(SHARD_SETTINGS["poll_interval"])
+
+
+def merge_book(book_id, output):
+    """Join the shards' speech into output (a binary file) and return the book's segments, in order."""
+    queue = open_shard_queue()
+    book = queue.load_book(book_id)
+    segments = []
+    with span("merge", book=book_id) as record:
+        for shard in book["shards"]:
+            with open(queue.shard_path(book_id, shard["number"], ".json"), encoding="utf-8") as result:
+                segments.extend(json.load(result)["segments"])
+            # MP3 frames can simply be concatenated; copy file by file so memory use stays small
+            with open(queue.shard_path(book_id, shard["number"], ".mp3"), "rb") as speech:
+                shutil.copyfileobj(speech, output, 1024 * 1024)
+        record["bytes_out"] = output.tell()
+    for index, segment in enumerate(segments):
+        segment["index"] = index
+    return segments
+
+
+def translate_book(audio_file, name, source_lang, target_lang, chunk_size, output, on_progress=None, **options):
+    """Coordinate one book across the worker nodes: submit it, wait for its shards and merge them into output.
+
+    options are passed on to submit_book(). Returns the book's segments.
+    """
+    book_id = submit_book(audio_file, name, source_lang, target_lang, chunk_size, **options)
+    wait_for_book(book_id, on_progress)
+    return merge_book(book_id, output)
+
+
+def parse_args(argv):
+    from cli import language_code
+
+    parser = argparse.ArgumentParser(description="Translate one audiobook on several machines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    work = commands.add_parser("work", help="Run shards from the queue on this machine")
+    work.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes to run")
+
+    coordinate = commands.add_parser("coordinate", help="Split a book into shards and merge the results")
+    coordinate.add_argument("input", help="Audio file to translate")
+    coordinate.add_argument("--source", type=language_code, default="en", help="Source language name or code")
+    coordinate.add_argument("--target", type=language_code, default="es", help="Target language name or code")
+    coordinate.add_argument("--chunk-size", type=int, default=AUDIO_SETTINGS["chunk_size_default"],
+                            help="Audio chunk size in seconds")
+    coordinate.add_argument("--asr-backend", help="Speech recognizer to use")
+    coordinate.add_argument("--translation-backend", help="Translation service to use")
+    coordinate.add_argument("--tts-backend", help="Text-to-speech service to use")
+    coordinate.add_argument("--shard-seconds", type=float, default=SHARD_SETTINGS["shard_seconds"],
+                            help="Audio per shard, in seconds")
+    coordinate.add_argument("--output", required=True, help="Where to write the translated MP3")
+    coordinate.add_argument("--transcript", help="Where to write the transcript and translation as JSON")
+    coordinate.add_argument("--workers", type=int, default=0,
+                            help="Worker processes to run on this machine as well")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command-line entry point: run shard workers, or coordinate one book."""
+    args = parse_args(argv)
+    if args.command == "work":
+        workers = start_workers(args.workers)
+        print(f"{len(workers)} workers serving the shard queue in {SHARD_SETTINGS['directory']}")
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # A shard cut short is picked up again once its claim goes stale
+            pass
+        return 0
+
+    start_workers(args.workers)
+
+    def report(progress):
+        print(f"\r{progress['completed']}/{progress['shards']} shards done, {progress['running']} running",
+              end="", file=sys.stderr, flush=True)
+
+    try:
+        with open(args.input, "rb") as audio_file, open(args.output, "wb") as output:
+            segments = translate_book(
+                audio_file, os.path.basename(args.input), args.source, args.target, args.chunk_size, output,
+                on_progress=report, asr_backend=args.asr_backend, translation_backend=args.translation_backend,
+                tts_backend=args.tts_backend, shard_seconds=args.shard_seconds
+            )
+    except ShardFailedError as e:
+        print(f"\nerror: {e}", file=sys.stderr)
+        return 1
+    print(file=sys.stderr)
+
+    if args.transcript:
+        with open(args.transcript, "w", encoding="utf-8") as transcript:
+            json.dump({"source": args.source, "target": args.target, "segments": segments},
+                      transcript, ensure_ascii=False, indent=2)
+    flush(force=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
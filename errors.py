@@ -0,0 +1,55 @@
+# errors.py
+"""Exception types raised by the processing modules of the Language Audiobook Translator.
+
+The processing modules raise these instead of rendering errors themselves,
+so the Streamlit app and the command-line runner can each report them in
+their own way.
+"""
+
+
+class AudiobookError(Exception):
+    """Base class for errors raised while processing an audiobook."""
+
+
+class AudioConversionError(AudiobookError):
+    """The uploaded audio could not be converted to WAV."""
+
+
+class FFmpegNotFoundError(AudioConversionError):
+    """FFmpeg, needed to decode non-WAV formats, is not installed."""
+
+
+class TranscriptionError(AudiobookError):
+    """Speech recognition failed, even after retrying."""
+
+
+class TranslationError(AudiobookError):
+    """Every translation backend failed, even after retrying."""
+
+
+class SynthesisError(AudiobookError):
+    """Text-to-speech synthesis failed."""
+
+
+class ShardFailedError(AudiobookError):
+    """A shard of a book split across worker nodes failed on every attempt."""
+
+
+class BackendUnavailableError(AudiobookError):
+    """A selected backend is unknown or its optional dependencies/models are not installed."""
+
+
+class ServiceError(AudiobookError):
+    """An external service answered a request with an error; status is its HTTP status code."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class RateLimitedError(ServiceError):
+    """An external service is throttling us (HTTP 429); retry_after is the wait it asked for, if any."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message, status=429)
+        self.retry_after = retry_after
\ No newline at end of file
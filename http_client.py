@@ -0,0 +1,122 @@
+# http_client.py
+"""Shared, pooled HTTP client for the network stages of the Language Audiobook Translator.
+
+Every recognition, translation and synthesis request made by this app goes
+through one requests.Session per process, so connections (and their TLS
+handshakes) are kept alive and reused across segments instead of being
+set up again for every call. Requests to any one host are capped at
+HTTP_SETTINGS["per_host_limit"] at a time.
+"""
+
+import os
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from config import HTTP_SETTINGS
+from errors import ServiceError, RateLimitedError
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+# Per-host semaphores capping concurrent requests
+_host_slots = {}
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use (and again after a fork)."""
+    global _session, _session_pid
+    with _session_lock:
+        # Sockets must not be shared with a parent process
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_SETTINGS["pool_hosts"],
+                pool_maxsize=HTTP_SETTINGS["pool_size"]
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pid = session, os.getpid()
+            _host_slots.clear()
+        return _session
+
+
+def _host_slot(url):
+    """Return the semaphore limiting concurrent requests to url's host."""
+    host = urlsplit(url).netloc
+    with _session_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(HTTP_SETTINGS["per_host_limit"])
+        return _host_slots[host]
+
+
+def request(method, url, **kwargs):
+    """Make a request on the shared session, waiting for a free slot for the host first."""
+    session = get_session()
+    kwargs.setdefault("timeout", HTTP_SETTINGS["timeout"])
+    with _host_slot(url):
+        return session.request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    """GET url on the shared session."""
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    """POST to url on the shared session."""
+    return request("POST", url, **kwargs)
+
+
+def send(prepared, **kwargs):
+    """Send an already prepared request (e.g. one built by a client library) on the shared session."""
+    session = get_session()
+    kwargs.setdefault("timeout", HTTP_SETTINGS["timeout"])
+    with _host_slot(prepared.url):
+        return session.send(prepared, **kwargs)
+
+
+def raise_for_status(response):
+    """Raise RateLimitedError for an HTTP 429 answer and ServiceError for any other error status."""
+    if response.status_code == 429:
+        try:
+            retry_after = float(response.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            retry_after = None
+        raise RateLimitedError(f"{urlsplit(response.url).netloc} is rate limiting requests", retry_after)
+    if response.status_code >= 400:
+        raise ServiceError(
+            f"{urlsplit(response.url).netloc} answered HTTP {response.status_code}", response.status_code
+        )
+
+
+def connection_stats():
+    """Return request and connection counts per host, to confirm connections are being reused.
+
+    "reused" counts requests that went over an already open connection;
+    a reuse_rate near 1.0 means almost no new connections were needed.
+    """
+    hosts = {}
+    with _session_lock:
+        session = _session
+    if session is not None:
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = f"{pool.scheme}://{pool.host}:{pool.port}"
+                hosts[host] = {"requests": pool.num_requests, "connections": pool.num_connections}
+
+    requests_made = sum(host["requests"] for host in hosts.values())
+    connections = sum(host["connections"] for host in hosts.values())
+    reused = max(requests_made - connections, 0)
+    return {
+        "requests": requests_made,
+        "connections": connections,
+        "reused": reused,
+        "reuse_rate": reused / requests_made if requests_made else 0.0,
+        "hosts": hosts
+    }
\ No newline at end of file
@@ -0,0 +1,264 @@
+# job_queue.py
+"""Background job queue for the Language Audiobook Translator.
+
+The Streamlit app only submits jobs and polls their progress; converting,
+transcribing, translating and synthesizing happen in a pool of local
+worker processes that take queued jobs from the job store one at a time
+(or one group at a time, for a book translated into several languages).
+The app starts QUEUE_SETTINGS["workers"] workers itself, or they can be
+run separately:
+
+    python job_queue.py --workers 4
+"""
+
+import argparse
+import os
+import threading
+import time
+from contextlib import ExitStack
+from config import QUEUE_SETTINGS, JOB_SETTINGS
+from job_store import open_job_store, job_ids_for, resolve_backends, SEGMENT_STATES
+from metrics import span, inc, emit, flush
+from concurrency import worker_name, poll_work, start_processes
+
+_workers = []
+
+
+def submit_jobs(audio_file, name, source_lang, target_langs, chunk_size, asr_backend=None, translation_backend=None,
+                tts_backend=None):
+    """Queue the audio for translation into each of target_langs and return {target language: job ID}.
+
+    The languages still to be done are queued as one group that a single
+    worker runs together, decoding and transcribing the audio only once.
+    The same file and settings always give the same jobs, so resubmitting a
+    job that is queued, running or finished doesn't start it again, and
+    resubmitting a failed one resumes it from its last finished segment.
+    The backends are resolved now and stored with the jobs, so the workers
+    use the ones submitted whatever their own environment says.
+    """
+    store = open_job_store()
+    backends = resolve_backends(asr_backend, translation_backend, tts_backend)
+    group_id, job_ids = job_ids_for(audio_file, source_lang, target_langs, chunk_size, **backends)
+
+    pending = []
+    for target_lang, job_id in job_ids.items():
+        job = store.create_job(job_id, name, source_lang, target_lang, chunk_size)
+        if job["status"] in ("queued", "running"):
+            continue
+        if job["status"] == "completed" and os.path.exists(store.output_path(job_id)):
+            # Asked for again: keep it from being pruned for another retention period
+            store.update_job(job_id, status="completed")
+            continue
+        pending.append(job_id)
+
+    if pending:
+        # One copy of the input serves the whole group
+        input_path = store.store_input(pending[0], audio_file, name)
+        store.update_jobs(pending, input_path=input_path, **backends,
+                          group_id=group_id if len(pending) > 1 else None, status="queued", error=None,
+                          error_type=None)
+    return job_ids
+
+
+def submit_job(audio_file, name, source_lang, target_lang, chunk_size, asr_backend=None, translation_backend=None,
+               tts_backend=None):
+    """Queue the audio for translation into one language and return its job ID (see submit_jobs())."""
+    return submit_jobs(audio_file, name, source_lang, [target_lang], chunk_size, asr_backend, translation_backend,
+                       tts_backend)[target_lang]
+
+
+def run_jobs(jobs):
+    """Process claimed jobs, writing their MP3s to the job store; failures are recorded on each job.
+
+    The jobs of a group share one input, which is decoded and transcribed
+    once for all of them (see pipeline.translate_audiobook_multi()). Every
+    JOB_SETTINGS["chapter_seconds"] of audio, the segments finished since
+    the last chapter are also written out as a chapter file, so the start
+    of the book can be listened to while the rest is translated.
+
+    A heartbeat thread keeps the jobs from looking stale while the work goes
+    on, however long the decode takes. Should a job be handed to another
+    worker anyway, this worker stops working on it: each MP3 is written to a
+    file of this worker's own and only moved into place by the worker that
+    still holds the job.
+    """
+    # Imported here so the app process never loads the processing modules
+    from audio_processor import convert_audio_format, get_audio_duration, get_audio_info
+    from pipeline import translate_audiobook_multi
+    from translation_module import warm_translation_cache
+
+    store = open_job_store()
+    first = jobs[0]
+    jobs_by_target = {job["target"]: job for job in jobs}
+    job_ids = [job["id"] for job in jobs]
+    # Per language: the segments of the chapter being collected, and the chapters written so far
+    chapters = {target_lang: ([], [0]) for target_lang in jobs_by_target}
+    held = set(job_ids)
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(QUEUE_SETTINGS["heartbeat_interval"]):
+            held.intersection_update(store.touch_jobs(job_ids))
+
+    def partial_path(job):
+        return f"{store.output_path(job['id'])}.{os.getpid()}.part"
+
+    def on_segment(target_lang, segment):
+        job = jobs_by_target[target_lang]
+        # Before the job's output is made final, ask the store rather than wait for the next heartbeat
+        if segment is None and job["id"] not in store.touch_jobs([job["id"]]):
+            held.discard(job["id"])
+        if job["id"] not in held:
+            raise RuntimeError(f"Job {job['id']} was handed to another worker")
+        chapter, written = chapters[target_lang]
+        # None follows the last segment: whatever is collected is the last chapter
+        if chapter and (segment is None or segment["start"] - chapter[0]["start"] >= JOB_SETTINGS["chapter_seconds"]):
+            store.write_chapter(jobs_by_target[target_lang]["id"], written[0],
+                                [finished["index"] for finished in chapter])
+            written[0] += 1
+            chapter.clear()
+        if segment is not None:
+            chapter.append(segment)
+        else:
+            # The pipeline has flushed the whole MP3
+            os.replace(partial_path(job), store.output_path(job["id"]))
+
+    def open_output(job):
+        path = partial_path(job)
+        # Only the job the input was stored for has its directory already
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return outputs.enter_context(open(path, "wb"))
+
+    threading.Thread(target=heartbeat, name="job-heartbeat", daemon=True).start()
+    started = time.monotonic()
+    for job in jobs:
+        emit("job", job=job["id"], status="running", worker=job["worker"], group=job["group_id"])
+    try:
+        with open(first["input_path"], "rb") as audio_file, ExitStack() as outputs:
+            with span("decode", jobs=job_ids) as record:
+                record["bytes_in"] = os.path.getsize(first["input_path"])
+                wav_audio = convert_audio_format(audio_file)
+                wav_audio.seek(0, os.SEEK_END)
+                record["bytes_out"] = wav_audio.tell()
+                wav_audio.seek(0)
+            store.update_jobs(job_ids, duration=get_audio_duration(wav_audio), audio_info=get_audio_info(wav_audio))
+            results = translate_audiobook_multi(
+                wav_audio, first["source"], list(jobs_by_target), first["chunk_size"],
+                outputs={job["target"]: open_output(job) for job in jobs},
+                on_segment=on_segment,
+                job_ids={job["target"]: job["id"] for job in jobs},
+                asr_backend=first["asr_backend"],
+                translation_backend=first["translation_backend"],
+                tts_backend=first["tts_backend"]
+            )
+    except Exception as e:
+        results = {target_lang: e for target_lang in jobs_by_target}
+    finally:
+        stopped.set()
+
+    for target_lang, result in results.items():
+        job = jobs_by_target[target_lang]
+        job_id = job["id"]
+        if os.path.exists(partial_path(job)):
+            os.remove(partial_path(job))
+        seconds = round(time.monotonic() - started, 3)
+        if isinstance(result, Exception):
+            store.update_job(job_id, status="failed", error=str(result), error_type=type(result).__name__)
+            inc("audiobook_jobs_total", status="failed")
+            emit("job", job=job_id, status="failed", error_type=type(result).__name__, seconds=seconds)
+        else:
+            # Runs of the same book with another chunk size then find its sentences already translated
+            pairs = [(segment["text"], segment["translation"]) for segment in store.segments(job_id).values()]
+            warm_translation_cache(pairs, first["source"], target_lang, job["translation_backend"])
+            inc("audiobook_jobs_total", status="completed")
+            emit("job", job=job_id, status="completed", seconds=seconds)
+    flush(force=True)
+
+
+def worker_loop(stop=None):
+    """Run queued jobs one after another until stop (a multiprocessing.Event) is set."""
+    store = open_job_store()
+    store.worker = worker_name()
+    next_prune = 0.0
+
+    def claim():
+        nonlocal next_prune
+        # Finished jobs past their retention period go first, then every prune_interval
+        if JOB_SETTINGS["retention_days"] and time.monotonic() >= next_prune:
+            pruned = store.prune_jobs(JOB_SETTINGS["retention_days"] * 24 * 3600)
+            if pruned:
+                emit("prune", jobs=len(pruned))
+            next_prune = time.monotonic() + QUEUE_SETTINGS["prune_interval"]
+        return store.claim_jobs(store.worker, QUEUE_SETTINGS["stale_after"])
+
+    poll_work(claim, run_jobs, QUEUE_SETTINGS["poll_interval"], stop)
+
+
+def start_workers(count=None):
+    """Start worker processes (QUEUE_SETTINGS["workers"] by default) and return them."""
+    count = QUEUE_SETTINGS["workers"] if count is None else count
+    return start_processes(worker_loop, count, "audiobook-worker")
+
+
+def ensure_workers():
+    """Make sure this process's pool of worker processes is running, replacing any that died."""
+    global _workers
+    alive = [worker for worker in _workers if worker.is_alive()]
+    missing = QUEUE_SETTINGS["workers"] - len(alive)
+    _workers = alive + (start_workers(missing) if missing > 0 else [])
+    return _workers
+
+
+def job_progress(job_id):
+    """Return a job's status and its results so far, for polling from the UI.
+
+    The dict holds the job record plus: done (seconds of audio finished),
+    fraction (0.0 - 1.0), position (jobs queued ahead of it), stages (how
+    many segments got through each stage), chapter_paths (the chapter MP3s
+    written so far), and the transcript and translation of the segments
+    finished so far.
+    """
+    store = open_job_store()
+    job = store.get_job(job_id)
+    if job is None:
+        return None
+
+    segments = [segment for _, segment in sorted(store.segments(job_id).items())]
+    done = sum(segment["end"] - segment["start"] for segment in segments if segment["state"] == "synthesized")
+    job["done"] = done
+    job["fraction"] = min(done / job["duration"], 1.0) if job["duration"] else 0.0
+    if job["status"] == "completed":
+        job["fraction"] = 1.0
+    job["position"] = store.queue_position(job_id) if job["status"] == "queued" else 0
+    # A segment that is translated has been transcribed too, and so on
+    reached = [SEGMENT_STATES.index(segment["state"]) for segment in segments]
+    job["stages"] = {state: sum(1 for level in reached if level >= SEGMENT_STATES.index(state))
+                     for state in SEGMENT_STATES[1:]}
+    job["chapter_paths"] = [store.chapter_path(job_id, number) for number in range(job["chapters"] or 0)]
+    job["transcript"] = [segment["text"] for segment in segments if segment["text"]]
+    job["translation"] = [segment["translation"] for segment in segments if segment["translation"]]
+    return job
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run audiobook translation workers for the job queue.")
+    parser.add_argument("--workers", type=int, default=QUEUE_SETTINGS["workers"] or os.cpu_count() or 1,
+                        help="Worker processes to run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command-line entry point: serve the queue until interrupted."""
+    args = parse_args(argv)
+    workers = start_workers(args.workers)
+    print(f"{len(workers)} workers serving the job queue in {open_job_store().directory}")
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # Workers get the interrupt too; a job cut short is picked up again once it goes stale
+        pass
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
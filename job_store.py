@@ -0,0 +1,359 @@
+# job_store.py
+"""Durable, resumable job state for the Language Audiobook Translator."""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from config import JOB_SETTINGS, ASR_SETTINGS, TRANSLATION_SETTINGS, TTS_SETTINGS
+
+# Per-segment progress, in the order a segment moves through them
+SEGMENT_STATES = ("pending", "transcribed", "translated", "synthesized")
+
+# Columns added to the jobs table after its first release, with their types
+_JOB_COLUMNS = {
+    "input_path": "TEXT",     # Copy of the uploaded audio, for queued jobs
+    "asr_backend": "TEXT",
+    "worker": "TEXT",         # Worker process that claimed the job
+    "duration": "REAL",       # Seconds of audio, once converted
+    "audio_info": "TEXT",
+    "error_type": "TEXT",     # Exception class of the failure, for the UI to explain it
+    "chapters": "INTEGER",    # Chapters of the output written so far, for listening before the job ends
+    "group_id": "TEXT",       # Jobs submitted together for several target languages, run as one
+    "translation_backend": "TEXT",
+    "tts_backend": "TEXT"
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def fingerprint_file(audio_file, block_size=1024 * 1024):
+    """Return a SHA-256 hex digest of a file object's contents, leaving it rewound."""
+    digest = hashlib.sha256()
+    audio_file.seek(0)
+    for block in iter(lambda: audio_file.read(block_size), b""):
+        digest.update(block)
+    audio_file.seek(0)
+    return digest.hexdigest()
+
+
+def resolve_backends(asr_backend=None, translation_backend=None, tts_backend=None):
+    """The backends a job runs with: the ones given, or else the configured defaults."""
+    return {
+        "asr_backend": asr_backend or ASR_SETTINGS["backend"],
+        "translation_backend": translation_backend or TRANSLATION_SETTINGS["backend"],
+        "tts_backend": tts_backend or TTS_SETTINGS["backend"]
+    }
+
+
+def _job_key(fingerprint, source_lang, target_lang, chunk_size, backends, variant):
+    # Imported here: it loads SpeechRecognition, which the app only needs once something is submitted
+    from recognizer_backends import recognizer_settings
+
+    parts = [fingerprint, source_lang, target_lang, str(chunk_size), backends["asr_backend"],
+             recognizer_settings(backends["asr_backend"]), backends["translation_backend"],
+             backends["tts_backend"], variant]
+    return hashlib.sha256(":".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def job_id_for(audio_file, source_lang, target_lang, chunk_size, asr_backend=None, translation_backend=None,
+               tts_backend=None, variant=""):
+    """Job ID for translating this audio with these settings - the same inputs always resume the same job.
+
+    The backends (resolved with resolve_backends()) and the recognizer's
+    model and language settings are part of the ID, so changing any of them
+    starts a new job rather than reusing the old one's results. variant
+    holds anything else the output depends on (e.g. the shard length of a
+    distributed book).
+    """
+    backends = resolve_backends(asr_backend, translation_backend, tts_backend)
+    return _job_key(fingerprint_file(audio_file), source_lang, target_lang, chunk_size, backends, variant)
+
+
+def job_ids_for(audio_file, source_lang, target_langs, chunk_size, asr_backend=None, translation_backend=None,
+                tts_backend=None):
+    """Return (group ID, {target language: job ID}) for translating this audio into several languages.
+
+    Each job ID is the one job_id_for() gives for its language, but the file
+    is only read once.
+    """
+    backends = resolve_backends(asr_backend, translation_backend, tts_backend)
+    fingerprint = fingerprint_file(audio_file)
+    job_ids = {target_lang: _job_key(fingerprint, source_lang, target_lang, chunk_size, backends, "")
+               for target_lang in target_langs}
+    group_id = _job_key(fingerprint, source_lang, "+".join(sorted(target_langs)), chunk_size, backends, "")
+    return group_id, job_ids
+
+
+class JobStore:
+    """Jobs and their per-segment progress in SQLite, with synthesized audio stored beside it."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        # Set in queue worker processes: status changes then only apply to jobs this worker still holds
+        self.worker = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "jobs.sqlite3"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, name TEXT, source TEXT, target TEXT, chunk_size INTEGER,"
+            " status TEXT NOT NULL, error TEXT, created REAL NOT NULL, updated REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS segments ("
+            " job_id TEXT NOT NULL, idx INTEGER NOT NULL, start REAL, end REAL,"
+            " text TEXT, translation TEXT, state TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, idx));"
+        )
+        existing = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in _JOB_COLUMNS.items():
+            if column not in existing:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.commit()
+
+    def create_job(self, job_id, name, source_lang, target_lang, chunk_size):
+        """Create the job if it doesn't exist yet and return its record."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO jobs (id, name, source, target, chunk_size, status, created, updated)"
+                " VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)",
+                (job_id, name, source_lang, target_lang, chunk_size, now, now)
+            )
+            self._db.commit()
+        return self.get_job(job_id)
+
+    def get_job(self, job_id):
+        """Return the job record as a dict, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, status=None):
+        """Return all jobs (optionally only those with the given status), newest first."""
+        query, params = "SELECT * FROM jobs", ()
+        if status:
+            query, params = query + " WHERE status = ?", (status,)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY updated DESC", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def _owned(self):
+        """SQL condition (and its parameters) limiting an update to jobs this store's worker holds."""
+        if self.worker is None:
+            return "", ()
+        return " AND (worker IS NULL OR worker = ?)", (self.worker,)
+
+    def set_status(self, job_id, status, error=None):
+        """Record the overall status of a job ('pending', 'queued', 'running', 'completed' or 'failed')."""
+        condition, params = self._owned()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?" + condition,
+                (status, error, time.time(), job_id) + params
+            )
+            self._db.commit()
+
+    def update_job(self, job_id, **fields):
+        """Set any of the job's columns, e.g. update_job(job_id, duration=12.5)."""
+        self.update_jobs([job_id], **fields)
+
+    def update_jobs(self, job_ids, **fields):
+        """Set the same columns of several jobs in one transaction."""
+        columns = [column for column in fields if column in _JOB_COLUMNS or column in ("status", "error")]
+        if not columns:
+            return
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        condition, params = self._owned()
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                f"UPDATE jobs SET {assignments}, updated = ? WHERE id = ?" + condition,
+                [[fields[column] for column in columns] + [now, job_id] + list(params) for job_id in job_ids]
+            )
+            self._db.commit()
+
+    def touch_jobs(self, job_ids):
+        """Mark running jobs held by this store's worker as making progress; returns the IDs it still holds.
+
+        A job that went stale and was claimed by another worker is no longer
+        in the list.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "UPDATE jobs SET updated = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                [(now, job_id, self.worker) for job_id in job_ids]
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                f"SELECT id FROM jobs WHERE worker = ? AND status = 'running'"
+                f" AND id IN ({', '.join('?' * len(job_ids))})",
+                [self.worker] + list(job_ids)
+            ).fetchall()
+        return {row["id"] for row in rows}
+
+    def claim_jobs(self, worker, stale_after):
+        """Atomically hand the oldest queued job to worker, marking it running, and return it in a list.
+
+        The other jobs of its group (the same audio for other target
+        languages) are claimed with it, so they can share the decoding and
+        transcription. Jobs whose worker has made no progress for
+        stale_after seconds are assumed to have died with it and are handed
+        out again. Returns an empty list when there is nothing to do.
+        """
+        now = time.time()
+        claimable = "(status = 'queued' OR (status = 'running' AND worker IS NOT NULL AND updated < ?))"
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes can't claim the same job
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    f"SELECT id, group_id FROM jobs WHERE {claimable} ORDER BY created LIMIT 1",
+                    (now - stale_after,)
+                ).fetchone()
+                ids = []
+                if row:
+                    ids = [row["id"]]
+                    if row["group_id"]:
+                        ids += [other["id"] for other in self._db.execute(
+                            f"SELECT id FROM jobs WHERE group_id = ? AND id != ? AND {claimable} ORDER BY id",
+                            (row["group_id"], row["id"], now - stale_after)
+                        )]
+                    self._db.executemany(
+                        "UPDATE jobs SET status = 'running', worker = ?, error = NULL, updated = ? WHERE id = ?",
+                        [(worker, now, job_id) for job_id in ids]
+                    )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return [self.get_job(job_id) for job_id in ids]
+
+    def queue_position(self, job_id):
+        """Number of queued jobs that will be started before this one."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+                " AND created < (SELECT created FROM jobs WHERE id = ?)",
+                (job_id,)
+            ).fetchone()
+        return row[0]
+
+    def segments(self, job_id):
+        """Return {index: segment dict} for every segment of the job recorded so far."""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM segments WHERE job_id = ?", (job_id,)).fetchall()
+        return {row["idx"]: dict(row) for row in rows}
+
+    def save_segment(self, job_id, index, state, **fields):
+        """Record that a segment reached state, along with any of start, end, text and translation."""
+        columns = ["start", "end", "text", "translation"]
+        values = [fields.get(column) for column in columns]
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO segments (job_id, idx, start, end, text, translation, state)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (job_id, idx) DO UPDATE SET"
+                " start = COALESCE(excluded.start, start), end = COALESCE(excluded.end, end),"
+                " text = COALESCE(excluded.text, text),"
+                " translation = COALESCE(excluded.translation, translation), state = excluded.state",
+                [job_id, index] + values + [state]
+            )
+            self._db.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id))
+            self._db.commit()
+
+    def store_input(self, job_id, audio_file, name):
+        """Copy a job's input audio next to the job (once) so a worker process can read it; returns its path."""
+        path = os.path.join(self.directory, job_id, "input" + os.path.splitext(name)[1].lower())
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            audio_file.seek(0)
+            with open(path + ".tmp", "wb") as stored:
+                shutil.copyfileobj(audio_file, stored, 1024 * 1024)
+            os.replace(path + ".tmp", path)
+            audio_file.seek(0)
+        return path
+
+    def output_path(self, job_id):
+        """Path of the translated MP3 of a job run by a queue worker."""
+        return os.path.join(self.directory, job_id, "output.mp3")
+
+    def chapter_path(self, job_id, number):
+        """Path of one finished chapter (a run of consecutive segments) of a job's MP3."""
+        return os.path.join(self.directory, job_id, f"chapter-{number:03d}.mp3")
+
+    def write_chapter(self, job_id, number, indexes):
+        """Join the stored speech of the segments at indexes into chapter number, and record it."""
+        path = self.chapter_path(job_id, number)
+        # MP3 frames can simply be concatenated; copy file by file so memory use stays small
+        with open(path + ".tmp", "wb") as chapter:
+            for index in indexes:
+                try:
+                    with open(self.speech_path(job_id, index), "rb") as speech:
+                        shutil.copyfileobj(speech, chapter, 1024 * 1024)
+                except FileNotFoundError:
+                    continue
+        os.replace(path + ".tmp", path)
+        self.update_job(job_id, chapters=number + 1)
+
+    def speech_path(self, job_id, index):
+        """Path of the synthesized MP3 for one segment of a job."""
+        return os.path.join(self.directory, job_id, f"{index:06d}.mp3")
+
+    def save_speech(self, job_id, index, audio):
+        """Store a segment's synthesized MP3 and mark the segment synthesized."""
+        path = self.speech_path(job_id, index)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a crash never leaves a half-written segment behind
+        with open(path + ".tmp", "wb") as speech:
+            speech.write(audio)
+        os.replace(path + ".tmp", path)
+        self.save_segment(job_id, index, "synthesized")
+
+    def load_speech(self, job_id, index):
+        """Return a segment's synthesized MP3, or None if it hasn't been stored."""
+        try:
+            with open(self.speech_path(job_id, index), "rb") as speech:
+                return speech.read()
+        except FileNotFoundError:
+            return None
+
+    def prune_jobs(self, max_age):
+        """Delete the completed and failed jobs, with their audio, not updated for max_age seconds.
+
+        Returns the IDs of the jobs deleted.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE status IN ('completed', 'failed') AND updated < ?",
+                (time.time() - max_age,)
+            ).fetchall()
+        for row in rows:
+            self.delete_job(row["id"])
+        return [row["id"] for row in rows]
+
+    def delete_job(self, job_id):
+        """Forget a job and its stored audio."""
+        with self._lock:
+            self._db.execute("DELETE FROM segments WHERE job_id = ?", (job_id,))
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._db.commit()
+        job_dir = os.path.join(self.directory, job_id)
+        if os.path.isdir(job_dir):
+            for name in os.listdir(job_dir):
+                os.remove(os.path.join(job_dir, name))
+            os.rmdir(job_dir)
+
+
+def open_job_store():
+    """Return the process-wide job store, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore(JOB_SETTINGS["directory"])
+        return _store
\ No newline at end of file
@@ -0,0 +1,308 @@
+# metrics.py
+"""Timing and counter instrumentation for the Language Audiobook Translator.
+
+Every stage records what it did here: timing spans for the decode,
+transcribe, translate and synthesize stages (and each segment going
+through them), bytes in and out, cache hits and misses, calls and retries
+per backend, and queue depths. The numbers are exposed two ways:
+
+- a structured event stream: one JSON object per line in
+  METRICS_SETTINGS["directory"]/events.jsonl, e.g.
+  {"event": "span", "stage": "translate", "seconds": 0.41, "job": "...", ...}
+- Prometheus text format, summed over every process (app, queue workers,
+  batch workers) that wrote a snapshot to METRICS_SETTINGS["directory"]:
+
+    python metrics.py --port 9109          # serve /metrics and /events
+    python metrics.py --textfile app.prom  # write once, for a textfile collector
+"""
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_SETTINGS
+
+# Metric descriptions, for the HELP lines of the Prometheus output
+METRICS = {
+    "audiobook_stage_seconds": ("summary", "Time spent in each processing stage"),
+    "audiobook_stage_bytes_in_total": ("counter", "Bytes handed to each processing stage"),
+    "audiobook_stage_bytes_out_total": ("counter", "Bytes produced by each processing stage"),
+    "audiobook_stage_errors_total": ("counter", "Stage runs that raised an error"),
+    "audiobook_cache_lookups_total": ("counter", "Cache lookups, by cache and result (hit or miss)"),
+    "audiobook_backend_calls_total": ("counter", "Calls to external backends, by outcome"),
+    "audiobook_backend_call_seconds": ("summary", "Duration of successful backend calls"),
+    "audiobook_backend_retries_total": ("counter", "Backend calls retried after a failure"),
+    "audiobook_backend_concurrency": ("gauge", "Current concurrency window of each backend"),
+    "audiobook_backend_rate": ("gauge", "Current request rate limit of each backend, per second"),
+    "audiobook_pipeline_queue_depth": ("gauge", "Items waiting for each pipeline stage"),
+    "audiobook_jobs_total": ("counter", "Jobs finished, by status"),
+    "audiobook_shards_total": ("counter", "Shards of distributed books finished, by status"),
+    "audiobook_jobs": ("gauge", "Jobs in the job store, by status")
+}
+
+_lock = threading.Lock()
+_counters = {}   # (name, labels) -> value
+_summaries = {}  # (name, labels) -> [count, sum]
+_gauges = {}     # (name, labels) -> value
+_last_flush = 0.0
+
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Add value to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Record one observation (e.g. a duration) in a summary."""
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries.setdefault(key, [0, 0.0])
+        summary[0] += 1
+        summary[1] += value
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to its current value."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def emit(event, **fields):
+    """Append one event to the event stream."""
+    record = dict(event=event, time=round(time.time(), 3), pid=os.getpid(), **fields)
+    path = os.path.join(METRICS_SETTINGS["directory"], "events.jsonl")
+    try:
+        os.makedirs(METRICS_SETTINGS["directory"], exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path) > METRICS_SETTINGS["events_max_bytes"]:
+            # Keep one older file around, like a log rotated by size
+            os.replace(path, path + ".1")
+        # One short append per line, so lines from different processes don't interleave
+        with open(path, "a", encoding="utf-8") as events:
+            events.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError:
+        # Instrumentation must never break the processing it watches
+        pass
+
+
+@contextmanager
+def span(stage, **fields):
+    """Time a block of work in a stage, recording it as a metric and as a "span" event.
+
+    Yields a dict the block can add to: bytes_in and bytes_out are counted
+    per stage, everything else (job ID, segment index, backend...) only goes
+    into the event.
+
+        with span("translate", job=job_id, segment=index) as record:
+            record["bytes_in"] = len(text.encode("utf-8"))
+    """
+    record = dict(fields)
+    started = time.monotonic()
+    error = None
+    try:
+        yield record
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        seconds = time.monotonic() - started
+        observe("audiobook_stage_seconds", seconds, stage=stage)
+        for direction in ("in", "out"):
+            if record.get(f"bytes_{direction}"):
+                inc(f"audiobook_stage_bytes_{direction}_total", record[f"bytes_{direction}"], stage=stage)
+        if error is not None:
+            inc("audiobook_stage_errors_total", stage=stage, error=type(error).__name__)
+            record["error"] = type(error).__name__
+        emit("span", stage=stage, seconds=round(seconds, 4), **record)
+        flush()
+
+
+def snapshot():
+    """Return this process's metrics as a JSON-serializable dict."""
+    with _lock:
+        return {
+            "counters": [[name, dict(labels), value] for (name, labels), value in _counters.items()],
+            "summaries": [
+                [name, dict(labels), count, total] for (name, labels), (count, total) in _summaries.items()
+            ],
+            "gauges": [[name, dict(labels), value] for (name, labels), value in _gauges.items()]
+        }
+
+
+def flush(force=False):
+    """Write this process's snapshot to the metrics directory, at most every flush_interval seconds."""
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < METRICS_SETTINGS["flush_interval"]:
+        return
+    _last_flush = now
+    path = os.path.join(METRICS_SETTINGS["directory"], f"{socket.gethostname()}-{os.getpid()}.json")
+    try:
+        os.makedirs(METRICS_SETTINGS["directory"], exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as snapshot_file:
+            json.dump(snapshot(), snapshot_file)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass
+
+
+def collect():
+    """Sum the snapshots of every process that has written one (this one included).
+
+    Gauges of processes that haven't written for METRICS_SETTINGS["stale_after"]
+    seconds are left out; their counters still count.
+    """
+    flush(force=True)
+    counters, summaries, gauges = {}, {}, {}
+    directory = METRICS_SETTINGS["directory"]
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, encoding="utf-8") as snapshot_file:
+                data = json.load(snapshot_file)
+            fresh = time.time() - os.path.getmtime(path) < METRICS_SETTINGS["stale_after"]
+        except (OSError, ValueError):
+            continue
+        for metric, labels, value in data["counters"]:
+            key = _key(metric, labels)
+            counters[key] = counters.get(key, 0) + value
+        for metric, labels, count, total in data["summaries"]:
+            summary = summaries.setdefault(_key(metric, labels), [0, 0.0])
+            summary[0] += count
+            summary[1] += total
+        if fresh:
+            for metric, labels, value in data["gauges"]:
+                key = _key(metric, labels)
+                gauges[key] = gauges.get(key, 0) + value
+    return counters, summaries, gauges
+
+
+def _job_gauges():
+    """Jobs in the job store by status - the depth of the job queue."""
+    from job_store import open_job_store
+
+    counts = {}
+    for job in open_job_store().list_jobs():
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+    return {_key("audiobook_jobs", {"status": status}): count for status, count in counts.items()}
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + sorted(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def prometheus_text():
+    """Render the metrics of all processes in the Prometheus text exposition format."""
+    counters, summaries, gauges = collect()
+    gauges.update(_job_gauges())
+    samples = {}
+    for (name, labels), value in counters.items():
+        samples.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), (count, total) in summaries.items():
+        samples.setdefault(name, []).append(f"{name}_count{_labels(labels)} {count}")
+        samples[name].append(f"{name}_sum{_labels(labels)} {total:.6f}")
+    for (name, labels), value in gauges.items():
+        samples.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+
+    lines = []
+    for name in sorted(samples):
+        kind, description = METRICS.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(sorted(samples[name]))
+    return "\n".join(lines) + "\n"
+
+
+def stage_totals():
+    """Seconds spent and runs per stage over all processes - where the time goes."""
+    _, summaries, _ = collect()
+    totals = {}
+    for (name, labels), (count, total) in summaries.items():
+        if name == "audiobook_stage_seconds":
+            totals[dict(labels)["stage"]] = {"runs": count, "seconds": total}
+    return totals
+
+
+def write_textfile(path):
+    """Write the Prometheus metrics to path, replacing it atomically."""
+    with open(path + ".tmp", "w", encoding="utf-8") as textfile:
+        textfile.write(prometheus_text())
+    os.replace(path + ".tmp", path)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves /metrics (Prometheus text) and /events (the event stream, newest last)."""
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = prometheus_text().encode("utf-8"), "text/plain; version=0.0.4"
+        elif self.path == "/events":
+            try:
+                with open(os.path.join(METRICS_SETTINGS["directory"], "events.jsonl"), "rb") as events:
+                    body = events.read()
+            except FileNotFoundError:
+                body = b""
+            content_type = "application/x-ndjson"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None):
+    """Serve /metrics and /events on a background thread and return the server."""
+    server = ThreadingHTTPServer(
+        (METRICS_SETTINGS["host"], METRICS_SETTINGS["port"] if port is None else port), MetricsRequestHandler
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Expose the audiobook translator's metrics to Prometheus.")
+    parser.add_argument("--host", default=METRICS_SETTINGS["host"])
+    parser.add_argument("--port", type=int, default=METRICS_SETTINGS["port"])
+    parser.add_argument("--textfile", help="Write the metrics to this file once and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command-line entry point: serve the metrics until interrupted, or write them to a file."""
+    args = parse_args(argv)
+    if args.textfile:
+        write_textfile(args.textfile)
+        return
+    server = ThreadingHTTPServer((args.host, args.port), MetricsRequestHandler)
+    print(f"Metrics on http://{args.host}:{args.port}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
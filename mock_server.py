@@ -0,0 +1,198 @@
+# mock_server.py
+"""Local stand-in for the translation and text-to-speech services.
+
+Answers the same requests as translate.googleapis.com (the "googleapis"
+translation backend), Google's web speech API (the "google" recognizer)
+and the "http" text-to-speech backend, entirely
+offline, with configurable latency, error rate and rate limit - so the
+pipeline can be load-tested and its retries exercised without a network:
+
+    python mock_server.py --port 8765 --latency 0.2 --error-rate 0.05 --rate-limit 20
+    AUDIOBOOK_TRANSLATION_BACKEND=googleapis \
+    AUDIOBOOK_TRANSLATE_URL=http://127.0.0.1:8765/translate_a/single \
+    AUDIOBOOK_TTS_BACKEND=http AUDIOBOOK_TTS_URL=http://127.0.0.1:8765/tts \
+    AUDIOBOOK_ASR_URL=http://127.0.0.1:8765/speech-api/v2/recognize \
+    python cli.py book.mp3
+
+Translations are the input lines tagged with the target language,
+transcripts just give the size of the audio, and speech is silence about
+as long as the text would take to read.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from config import MOCK_SERVER_SETTINGS
+from concurrency import TokenBucket
+from text_to_speech import silent_mp3, CHARS_PER_SECOND
+
+
+class MockServer(ThreadingHTTPServer):
+    """HTTP server holding the simulated service behaviour and request counters."""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=0.0, burst=10):
+        super().__init__(address, MockRequestHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.counts = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0}
+        self._counts_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key):
+        with self._counts_lock:
+            self.counts[key] += 1
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """Routes the fake APIs, after applying the simulated limits and failures."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self._handle(url.path, params)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            params.update({key: values[0] for key, values in parse_qs(body.decode()).items()})
+        self._handle(url.path, params, body)
+
+    def _handle(self, path, params, body=b""):
+        server = self.server
+        server.count("requests")
+
+        if server.bucket:
+            wait = server.bucket.take()
+            if wait:
+                server.count("rate_limited")
+                self._send(429, b"Too Many Requests", "text/plain", {"Retry-After": f"{wait:.3f}"})
+                return
+
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if random.random() < server.error_rate:
+            server.count("errors")
+            self._send(500, b"Simulated failure", "text/plain")
+            return
+
+        if path == "/translate_a/single":
+            response, content_type = self._translate(params), "application/json"
+        elif path == "/speech-api/v2/recognize":
+            response, content_type = self._recognize(params, body), "application/json"
+        elif path == "/tts":
+            response, content_type = silent_mp3(len(params.get("text", "")) / CHARS_PER_SECOND), "audio/mpeg"
+        elif path == "/stats":
+            response, content_type = json.dumps(server.counts).encode(), "application/json"
+        else:
+            self._send(404, b"Not Found", "text/plain")
+            return
+
+        server.count("ok")
+        self._send(200, response, content_type)
+
+    def _translate(self, params):
+        """Answer like the Google Translate API: the translation sentence by sentence."""
+        target = params.get("tl", "en")
+        lines = params.get("q", "").split("\n")
+        sentences = [[f"[{target}] {line}" + ("\n" if i < len(lines) - 1 else ""), line, None, None]
+                     for i, line in enumerate(lines)]
+        return json.dumps([sentences, None, params.get("sl", "auto")], ensure_ascii=False).encode("utf-8")
+
+    def _recognize(self, params, body):
+        """Answer like Google's web speech API: an empty result line, then the alternatives."""
+        transcript = f"{len(body)} bytes of speech in {params.get('lang', 'en-US')}"
+        result = {"result": [{"alternative": [{"transcript": transcript, "confidence": 0.9}], "final": True}],
+                  "result_index": 0}
+        return ('{"result":[]}\n' + json.dumps(result) + "\n").encode("utf-8")
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep load tests quiet
+        pass
+
+
+def start_mock_server(port=0, **options):
+    """Start a mock server on a background thread and return it (its .url says where it listens).
+
+    Options default to MOCK_SERVER_SETTINGS; port 0 picks a free port.
+    Stop the server with server.shutdown().
+    """
+    settings = dict(MOCK_SERVER_SETTINGS, **options)
+    server = MockServer(
+        (settings["host"], port),
+        latency=settings["latency"],
+        jitter=settings["jitter"],
+        error_rate=settings["error_rate"],
+        rate_limit=settings["rate_limit"],
+        burst=settings["burst"]
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Serve fake translation and text-to-speech APIs locally.")
+    parser.add_argument("--host", default=MOCK_SERVER_SETTINGS["host"])
+    parser.add_argument("--port", type=int, default=MOCK_SERVER_SETTINGS["port"])
+    parser.add_argument("--latency", type=float, default=MOCK_SERVER_SETTINGS["latency"],
+                        help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=MOCK_SERVER_SETTINGS["jitter"],
+                        help="Random extra latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=MOCK_SERVER_SETTINGS["error_rate"],
+                        help="Fraction of requests that fail with HTTP 500")
+    parser.add_argument("--rate-limit", type=float, default=MOCK_SERVER_SETTINGS["rate_limit"],
+                        help="Requests per second before answering HTTP 429 (0 = unlimited)")
+    parser.add_argument("--burst", type=int, default=MOCK_SERVER_SETTINGS["burst"],
+                        help="Requests allowed at once above the rate limit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command-line entry point: serve until interrupted."""
+    args = parse_args(argv)
+    server = MockServer(
+        (args.host, args.port),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        burst=args.burst
+    )
+    print(f"Mock translation/TTS server on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.counts))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
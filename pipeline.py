@@ -0,0 +1,363 @@
+# pipeline.py
+"""Pipelined processing engine for the Language Audiobook Translator."""
+
+import queue
+import tempfile
+import threading
+from collections import namedtuple
+from config import PIPELINE_SETTINGS, TTS_SETTINGS
+from speech_recognition_module import iter_speech_chunks, transcribe_chunk
+from translation_module import translate_passage
+from text_to_speech import synthesize_segments
+from job_store import open_job_store
+from metrics import span, set_gauge
+
+# A processing stage: func is applied to every item by `workers` threads
+Stage = namedtuple("Stage", ["name", "func", "workers"])
+
+# Passed down the queues once a stage has no more items
+_DONE = object()
+
+
+def run_pipeline(items, stages, queue_size=None, max_in_flight=None):
+    """Push items through the stages concurrently, yielding the final results in input order.
+
+    Stages are connected by bounded queues of queue_size, so a slow stage
+    holds back the ones before it instead of letting work pile up. At most
+    max_in_flight items are between the source and the output at once,
+    which also bounds how far results can run ahead of a slow early item.
+    The first exception raised by any stage stops the pipeline and is
+    re-raised to the caller.
+    """
+    queue_size = queue_size or PIPELINE_SETTINGS["queue_size"]
+    max_in_flight = max_in_flight or PIPELINE_SETTINGS["max_in_flight"]
+
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    in_flight = threading.Semaphore(max_in_flight)
+    stop = threading.Event()
+    errors = []
+
+    def put(target, entry):
+        """Put entry on a queue, giving up if the pipeline is stopped while waiting."""
+        while not stop.is_set():
+            try:
+                target.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fail(error):
+        errors.append(error)
+        stop.set()
+
+    def feed():
+        try:
+            for index, item in enumerate(items):
+                while not in_flight.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if not put(queues[0], (index, item)):
+                    return
+            put(queues[0], _DONE)
+        except Exception as e:
+            fail(e)
+
+    def work(stage, inbox, outbox, remaining, lock):
+        while not stop.is_set():
+            try:
+                entry = inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if entry is _DONE:
+                # Leave the marker for this stage's other workers; the last one passes it on
+                inbox.put(_DONE)
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    put(outbox, _DONE)
+                return
+
+            set_gauge("audiobook_pipeline_queue_depth", inbox.qsize(), stage=stage.name)
+            index, item = entry
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                fail(e)
+                return
+            put(outbox, (index, result))
+
+    threads = [threading.Thread(target=feed, name="pipeline-source", daemon=True)]
+    for position, stage in enumerate(stages):
+        remaining, lock = [stage.workers], threading.Lock()
+        for number in range(stage.workers):
+            threads.append(threading.Thread(
+                target=work,
+                args=(stage, queues[position], queues[position + 1], remaining, lock),
+                name=f"pipeline-{stage.name}-{number}",
+                daemon=True
+            ))
+    for thread in threads:
+        thread.start()
+
+    pending = {}
+    next_index = 0
+    try:
+        while not errors:
+            try:
+                entry = queues[-1].get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if entry is _DONE:
+                break
+
+            index, result = entry
+            pending[index] = result
+            while next_index in pending:
+                yield pending.pop(next_index)
+                in_flight.release()
+                next_index += 1
+
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        for stage in stages:
+            set_gauge("audiobook_pipeline_queue_depth", 0, stage=stage.name)
+
+
+def _checkpoint(done, index, bounds):
+    """Return what an earlier run of a job recorded for this chunk, if its boundaries still line up."""
+    previous = done.get(index)
+    if previous and abs(previous["start"] - bounds.start) < 1e-6 and abs(previous["end"] - bounds.end) < 1e-6:
+        return previous
+    return None
+
+
+class _Branch:
+    """The translate -> synthesize half of the pipeline for one target language."""
+
+    def __init__(self, source_lang, target_lang, output, job_id, store, translation_backend, tts_backend):
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        self.output = output if output is not None else tempfile.SpooledTemporaryFile(
+            max_size=TTS_SETTINGS["spool_max_bytes"], suffix=".mp3"
+        )
+        self.job_id = job_id
+        self.store = store if job_id else None
+        self.done = self.store.segments(job_id) if self.store else {}
+        self.translation_backend = translation_backend
+        self.tts_backend = tts_backend
+        self.inbox = queue.Queue(maxsize=PIPELINE_SETTINGS["queue_size"])
+        self.stopped = threading.Event()
+        self.segments = []
+        self.error = None
+
+    def deliver(self, entry):
+        """Hand a transcribed segment (or _DONE) to the branch, unless it has stopped."""
+        while not self.stopped.is_set():
+            try:
+                self.inbox.put(entry, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def items(self):
+        while True:
+            try:
+                entry = self.inbox.get(timeout=0.1)
+            except queue.Empty:
+                if self.stopped.is_set():
+                    return
+                continue
+            if entry is _DONE:
+                return
+            yield entry
+
+    def resume(self, segment, previous):
+        """This branch's copy of a transcribed segment, with whatever an earlier run already did for it."""
+        segment = {key: segment[key] for key in ("index", "start", "end", "text")}
+        if previous:
+            segment["translation"] = previous["translation"]
+            segment["synthesized"] = previous["state"] == "synthesized"
+        return segment
+
+    def translate(self, segment):
+        if segment.get("translation") is None:
+            with span("translate", job=self.job_id, segment=segment["index"],
+                      backend=self.translation_backend) as record:
+                record["bytes_in"] = len(segment["text"].encode("utf-8"))
+                segment["translation"] = (
+                    translate_passage(segment["text"], self.source_lang, self.target_lang, max_workers=1,
+                                      backend=self.translation_backend) if segment["text"] else ""
+                )
+                record["bytes_out"] = len(segment["translation"].encode("utf-8"))
+            if self.store:
+                self.store.save_segment(self.job_id, segment["index"], "translated",
+                                        translation=segment["translation"])
+        return segment
+
+    def synthesize(self, segment):
+        speech = None
+        if segment.pop("synthesized", False):
+            speech = self.store.load_speech(self.job_id, segment["index"])
+        if speech is None:
+            with span("synthesize", job=self.job_id, segment=segment["index"], backend=self.tts_backend) as record:
+                record["bytes_in"] = len(segment["translation"].encode("utf-8"))
+                speech = (
+                    b"".join(synthesize_segments(segment["translation"], self.target_lang, max_workers=1,
+                                                 backend=self.tts_backend))
+                    if segment["translation"] else b""
+                )
+                record["bytes_out"] = len(speech)
+            if self.store:
+                self.store.save_speech(self.job_id, segment["index"], speech)
+        segment["speech"] = speech
+        return segment
+
+
+def translate_audiobook(wav_audio, source_lang, target_lang, chunk_size, output=None, on_segment=None,
+                        job_id=None, asr_backend=None, translation_backend=None, tts_backend=None):
+    """Transcribe, translate and synthesize the audiobook as one pipeline over its speech chunks.
+
+    While one chunk is being synthesized the next ones are already being
+    translated and transcribed, so the total time approaches that of the
+    slowest stage rather than the sum of all of them. Each chunk's MP3 is
+    appended to output (a spooled temporary file by default) as soon as it
+    and every chunk before it are done, and on_segment is called with the
+    finished segment so callers can report progress or start playback, and
+    once more with None after the last segment, before the job is marked
+    completed.
+
+    With the job_id of a job created in the job store (see
+    job_store.job_id_for()), every segment's transcript, translation and
+    audio are checkpointed as they finish, and running the same job again
+    skips the work already done. asr_backend, translation_backend and
+    tts_backend select the services used for this job (the "backend" entry
+    of ASR_SETTINGS, TRANSLATION_SETTINGS and TTS_SETTINGS by default).
+
+    Returns (segments, output): a list of dicts with the start/end time,
+    transcript and translation of each chunk, and the rewound MP3 stream.
+    """
+    result = translate_audiobook_multi(
+        wav_audio, source_lang, [target_lang], chunk_size,
+        outputs={target_lang: output},
+        on_segment=(lambda _, segment: on_segment(segment)) if on_segment else None,
+        job_ids={target_lang: job_id},
+        asr_backend=asr_backend,
+        translation_backend=translation_backend,
+        tts_backend=tts_backend
+    )[target_lang]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def translate_audiobook_multi(wav_audio, source_lang, target_langs, chunk_size, outputs=None, on_segment=None,
+                              job_ids=None, asr_backend=None, translation_backend=None, tts_backend=None):
+    """Transcribe the audiobook once and translate and synthesize it into each of target_langs.
+
+    One upstream pipeline segments and transcribes the audio. Its segments
+    fan out to a translate -> synthesize branch per target language. Each
+    branch has its own stage workers and a bounded inbox, so the slowest
+    branch holds transcription back instead of letting segments pile up.
+    Decoding and recognition cost the same however many languages are made.
+
+    outputs and job_ids map target languages to their branch's output
+    stream and job store job, as for translate_audiobook(); on_segment is
+    called with (target_lang, segment), and with (target_lang, None) when
+    that branch is done.
+
+    Returns {target_lang: (segments, output)}. A failing branch doesn't
+    stop the others: its language maps to the exception instead, and its
+    job is marked failed.
+    """
+    outputs = outputs or {}
+    job_ids = job_ids or {}
+    store = open_job_store() if any(job_ids.values()) else None
+    branches = [
+        _Branch(source_lang, target_lang, outputs.get(target_lang), job_ids.get(target_lang), store,
+                translation_backend, tts_backend)
+        for target_lang in target_langs
+    ]
+    shared_jobs = [branch.job_id for branch in branches if branch.job_id]
+    upstream_errors = []
+
+    def transcribe(segment):
+        audio = segment.pop("audio")
+        if segment.get("text") is None:
+            with span("transcribe", jobs=shared_jobs, segment=segment["index"], backend=asr_backend) as record:
+                record["bytes_in"] = len(audio.frame_data)
+                segment["text"] = transcribe_chunk(audio, source_lang, asr_backend)
+                record["bytes_out"] = len(segment["text"].encode("utf-8"))
+        # Every job gets the transcript, whichever of them it came from
+        for branch, previous in zip(branches, segment["checkpoints"]):
+            if branch.store and (previous is None or previous["text"] is None):
+                branch.store.save_segment(branch.job_id, segment["index"], "transcribed", start=segment["start"],
+                                          end=segment["end"], text=segment["text"])
+        return segment
+
+    def resume(index, bounds):
+        """Pick up whatever was already done for this chunk in earlier runs of the jobs."""
+        checkpoints = [_checkpoint(branch.done, index, bounds) for branch in branches]
+        texts = [previous["text"] for previous in checkpoints if previous and previous["text"] is not None]
+        return {"index": index, "start": bounds.start, "end": bounds.end, "text": texts[0] if texts else None,
+                "checkpoints": checkpoints}
+
+    def run_branch(branch):
+        stages = [
+            Stage(f"translate-{branch.target_lang}", branch.translate, PIPELINE_SETTINGS["translate_workers"]),
+            Stage(f"synthesize-{branch.target_lang}", branch.synthesize, PIPELINE_SETTINGS["synthesize_workers"])
+        ]
+        try:
+            for segment in run_pipeline(branch.items(), stages):
+                branch.output.write(segment.pop("speech"))
+                branch.output.flush()
+                branch.segments.append(segment)
+                if on_segment:
+                    on_segment(branch.target_lang, segment)
+            if upstream_errors:
+                raise upstream_errors[0]
+            if on_segment:
+                on_segment(branch.target_lang, None)
+        except Exception as e:
+            branch.error = e
+            if branch.store:
+                branch.store.set_status(branch.job_id, "failed", str(e))
+        else:
+            if branch.store:
+                branch.store.set_status(branch.job_id, "completed")
+            branch.output.seek(0)
+        finally:
+            branch.stopped.set()
+
+    threads = [threading.Thread(target=run_branch, args=(branch,), name=f"pipeline-{branch.target_lang}",
+                                daemon=True) for branch in branches]
+    for branch in branches:
+        if branch.store:
+            branch.store.set_status(branch.job_id, "running")
+    for thread in threads:
+        thread.start()
+
+    chunks = (
+        dict(resume(index, bounds), audio=audio)
+        for index, (bounds, audio) in enumerate(iter_speech_chunks(wav_audio, chunk_size))
+    )
+    stages = [Stage("transcribe", transcribe, PIPELINE_SETTINGS["transcribe_workers"])]
+    try:
+        for segment in run_pipeline(chunks, stages):
+            if all(branch.stopped.is_set() for branch in branches):
+                break
+            for branch, previous in zip(branches, segment["checkpoints"]):
+                branch.deliver(branch.resume(segment, previous))
+    except Exception as e:
+        upstream_errors.append(e)
+    finally:
+        for branch in branches:
+            branch.deliver(_DONE)
+        for thread in threads:
+            thread.join()
+
+    return {branch.target_lang: branch.error or (branch.segments, branch.output) for branch in branches}
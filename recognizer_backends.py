@@ -0,0 +1,205 @@
+# recognizer_backends.py
+"""Speech recognizer backends for the Language Audiobook Translator.
+
+Every backend turns one chunk of audio (a speech_recognition AudioData)
+into text, and describes the settings its transcripts depend on for the
+transcription cache key. They return an empty string when nothing could be understood
+and raise sr.RequestError when a service request fails, so that the
+retry logic in speech_recognition_module works the same for all of them.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+import speech_recognition as sr
+import http_client
+from config import ASR_SETTINGS
+from errors import BackendUnavailableError, ServiceError
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+class GoogleRecognizer:
+    """Google's free web speech API - the original, rate-limited recognizer.
+
+    Makes the same request as SpeechRecognition's recognize_google(), but on
+    the shared, pooled HTTP session instead of a new connection per chunk,
+    to the endpoint and with the key in ASR_SETTINGS (AUDIOBOOK_ASR_URL and
+    AUDIOBOOK_ASR_KEY).
+    """
+
+    name = "google"
+
+    @classmethod
+    def settings(cls):
+        return f"url={ASR_SETTINGS['google_url']}"
+
+    def recognize(self, audio, language):
+        # The API wants 16-bit FLAC at 8 kHz or more
+        rate = audio.sample_rate if audio.sample_rate >= 8000 else 8000
+        try:
+            response = http_client.post(
+                ASR_SETTINGS["google_url"],
+                params={"client": "chromium", "lang": language, "key": ASR_SETTINGS["google_key"], "pFilter": 0},
+                data=audio.get_flac_data(convert_rate=rate, convert_width=2),
+                headers={"Content-Type": f"audio/x-flac; rate={rate}"}
+            )
+            http_client.raise_for_status(response)
+        except (requests.RequestException, ServiceError) as e:
+            raise sr.RequestError(f"recognition request failed: {e}") from e
+
+        # One JSON result per line; the first non-empty one holds the alternatives
+        for line in response.text.splitlines():
+            if not line:
+                continue
+            results = json.loads(line).get("result", [])
+            if results:
+                alternatives = results[0].get("alternative", [])
+                if alternatives and "transcript" in alternatives[0]:
+                    # Get the best alternative
+                    return alternatives[0]["transcript"]
+                break
+        # Silent or unclear chunk - don't fail the whole book over it
+        return ""
+
+
+class WhisperRecognizer:
+    """OpenAI Whisper running locally on the CPU.
+
+    The model is loaded once, on the first chunk, and then reused for every
+    chunk in the process; the chunks go to it as float32 samples at 16 kHz,
+    without the temporary WAV file recognize_whisper() would write.
+    """
+
+    name = "whisper"
+
+    def __init__(self):
+        try:
+            import whisper
+        except ImportError as e:
+            raise BackendUnavailableError("The whisper backend needs: pip install openai-whisper") from e
+        self.model = None
+        # Loading takes seconds and transcribing already uses every core - one chunk at a time
+        self.lock = threading.Lock()
+
+    @classmethod
+    def settings(cls):
+        return f"model={ASR_SETTINGS['whisper_model']}"
+
+    def recognize(self, audio, language):
+        import numpy as np
+        import whisper
+
+        # Whisper wants 16 kHz mono float32 in [-1, 1]
+        raw = audio.get_raw_data(convert_rate=16000, convert_width=2)
+        samples = np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+        with self.lock:
+            if self.model is None:
+                self.model = whisper.load_model(ASR_SETTINGS["whisper_model"])
+            # Whisper wants bare language codes ('zh', not 'zh-cn'); fp16 only works on a GPU
+            result = self.model.transcribe(samples, language=language.split('-')[0], fp16=False)
+        return result["text"].strip()
+
+
+class VoskRecognizer:
+    """Vosk (Kaldi) running locally on the CPU, with the model loaded once per process."""
+
+    name = "vosk"
+
+    def __init__(self):
+        try:
+            from vosk import Model
+        except ImportError as e:
+            raise BackendUnavailableError("The vosk backend needs: pip install vosk") from e
+        try:
+            self.model = Model(ASR_SETTINGS["vosk_model_path"])
+        except Exception as e:
+            raise BackendUnavailableError(
+                f"No Vosk model found at {ASR_SETTINGS['vosk_model_path']} - "
+                "download one from alphacephei.com/vosk/models"
+            ) from e
+
+    @classmethod
+    def settings(cls):
+        return f"model={os.path.abspath(ASR_SETTINGS['vosk_model_path'])}"
+
+    def recognize(self, audio, language):
+        from vosk import KaldiRecognizer
+
+        # Recognizers are cheap; the model is shared between threads
+        recognizer = KaldiRecognizer(self.model, audio.sample_rate)
+        recognizer.AcceptWaveform(audio.get_raw_data(convert_width=2))
+        return json.loads(recognizer.FinalResult()).get("text", "")
+
+
+class SphinxRecognizer:
+    """CMU PocketSphinx running locally on the CPU (English models by default)."""
+
+    name = "sphinx"
+
+    def __init__(self):
+        try:
+            import pocketsphinx
+        except ImportError as e:
+            raise BackendUnavailableError("The sphinx backend needs: pip install pocketsphinx") from e
+        self.recognizer = sr.Recognizer()
+
+    @classmethod
+    def settings(cls):
+        return f"language={ASR_SETTINGS['sphinx_language']}"
+
+    def recognize(self, audio, language):
+        try:
+            return self.recognizer.recognize_sphinx(audio, language=ASR_SETTINGS["sphinx_language"])
+        except sr.UnknownValueError:
+            return ""
+
+
+class StubRecognizer:
+    """Deterministic offline recognizer for tests and benchmarks.
+
+    Returns a short sentence derived from the audio contents, after an
+    optional simulated delay of ASR_SETTINGS["stub_latency"] seconds.
+    """
+
+    name = "stub"
+
+    @classmethod
+    def settings(cls):
+        return ""
+
+    def recognize(self, audio, language):
+        if ASR_SETTINGS["stub_latency"]:
+            time.sleep(ASR_SETTINGS["stub_latency"])
+        duration = len(audio.frame_data) / audio.sample_width / audio.sample_rate
+        fingerprint = hashlib.sha1(audio.frame_data).hexdigest()[:8]
+        return f"Segment {fingerprint} of {duration:.1f} seconds in {language}."
+
+
+RECOGNIZER_BACKENDS = {
+    backend.name: backend
+    for backend in (GoogleRecognizer, WhisperRecognizer, VoskRecognizer, SphinxRecognizer, StubRecognizer)
+}
+
+
+def recognizer_settings(name=None):
+    """The settings the named recognizer's transcripts depend on, without creating (or loading) it."""
+    name = name or ASR_SETTINGS["backend"]
+    if name not in RECOGNIZER_BACKENDS:
+        raise BackendUnavailableError(f"Unknown recognizer backend: {name}")
+    return RECOGNIZER_BACKENDS[name].settings()
+
+
+def get_recognizer_backend(name=None):
+    """Return the process-wide instance of the named recognizer backend (default: ASR_SETTINGS["backend"])."""
+    name = name or ASR_SETTINGS["backend"]
+    if name not in RECOGNIZER_BACKENDS:
+        raise BackendUnavailableError(f"Unknown recognizer backend: {name}")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = RECOGNIZER_BACKENDS[name]()
+        return _backends[name]
\ No newline at end of file
@@ -0,0 +1,195 @@
+# segmentation.py
+"""Voice-activity segmentation for the Language Audiobook Translator."""
+
+import wave
+from collections import namedtuple
+import numpy as np
+from config import VAD_SETTINGS
+
+# A stretch of speech, in seconds from the start of the audio
+SpeechSegment = namedtuple("SpeechSegment", ["start", "end"])
+
+SAMPLE_DTYPES = {2: "<i2", 4: "<i4"}
+
+
+def read_pcm(wav_audio):
+    """Return (samples, frame_rate, channels) for a 16/32-bit PCM WAV file.
+
+    When the audio is held in a BytesIO (Streamlit uploads) the samples are a
+    read-only view of its buffer, and when it is a real file (what
+    convert_audio_format() gives us) they are memory-mapped from disk, so
+    the audio is never copied into memory as a whole.
+    """
+    if hasattr(wav_audio, 'seek'):
+        wav_audio.seek(0)
+
+    with wave.open(wav_audio, 'rb') as wav:
+        frame_rate = wav.getframerate()
+        channels = wav.getnchannels()
+        sample_width = wav.getsampwidth()
+        nframes = wav.getnframes()
+        if sample_width not in SAMPLE_DTYPES:
+            raise ValueError(f"Unsupported sample width: {sample_width * 8}-bit")
+        dtype = np.dtype(SAMPLE_DTYPES[sample_width])
+
+        if hasattr(wav_audio, 'getbuffer'):
+            # wave.open() leaves the file positioned at the start of the data chunk
+            data_start = wav_audio.tell()
+            buffer = wav_audio.getbuffer()
+            available = (len(buffer) - data_start) // dtype.itemsize
+            count = min(nframes * channels, available)
+            samples = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start)
+        elif _has_fileno(wav_audio):
+            data_start = wav_audio.tell()
+            wav_audio.seek(0, 2)
+            available = (wav_audio.tell() - data_start) // dtype.itemsize
+            count = min(nframes * channels, available)
+            samples = np.memmap(wav_audio, dtype=dtype, mode='r', offset=data_start, shape=(count,))
+        else:
+            samples = np.frombuffer(wav.readframes(nframes), dtype=dtype)
+
+    return samples, frame_rate, channels
+
+
+def _has_fileno(audio_file):
+    """True if the file object is backed by a real file descriptor that can be memory-mapped."""
+    try:
+        audio_file.fileno()
+        return True
+    except (AttributeError, OSError, ValueError):
+        return False
+
+
+def mono_samples(samples, channels, start=0, end=None):
+    """Return frames start:end of interleaved samples mixed down to mono."""
+    frames = samples[start * channels:None if end is None else end * channels]
+    if channels == 1:
+        return frames
+    frames = frames[:len(frames) - len(frames) % channels].reshape(-1, channels)
+    return frames.mean(axis=1).astype(samples.dtype)
+
+
+def frame_features(samples, frame_rate, channels=1):
+    """Compute per-frame energy (dBFS) and zero-crossing rate, vectorized over blocks of frames."""
+    frame_len = int(frame_rate * VAD_SETTINGS["frame_ms"] / 1000)
+    n_frames = len(samples) // channels // frame_len
+    full_scale = float(np.iinfo(samples.dtype).max)
+    energy = np.empty(n_frames, dtype=np.float32)
+    zcr = np.empty(n_frames, dtype=np.float32)
+
+    # Work through the audio in blocks so the float copy stays small
+    block = VAD_SETTINGS["block_frames"]
+    for first in range(0, n_frames, block):
+        last = min(first + block, n_frames)
+        mono = mono_samples(samples, channels, first * frame_len, last * frame_len)
+        frames = mono.reshape(last - first, frame_len).astype(np.float32) / full_scale
+        power = np.einsum('ij,ij->i', frames, frames) / frame_len
+        energy[first:last] = 10 * np.log10(power + 1e-10)
+        signs = np.signbit(frames)
+        zcr[first:last] = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame_len
+
+    return energy, zcr
+
+
+def _runs(mask):
+    """Return (starts, ends) of the runs of True values in a boolean array."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def detect_speech(energy, zcr):
+    """Classify frames as speech using an adaptive noise floor, then smooth the decision."""
+    if not len(energy):
+        return np.zeros(0, dtype=bool)
+    noise_floor, loud = np.percentile(energy, [VAD_SETTINGS["noise_percentile"], VAD_SETTINGS["loud_percentile"]])
+    # With little dynamic range (music beds, constant noise) judge against the loud frames instead,
+    # so the whole recording isn't written off as background
+    threshold = min(noise_floor, loud - 2 * VAD_SETTINGS["energy_margin_db"]) + VAD_SETTINGS["energy_margin_db"]
+    threshold = max(threshold, VAD_SETTINGS["min_energy_db"])
+
+    # Quieter frames with a high zero-crossing rate are unvoiced consonants (s, f, th...)
+    speech = (energy > threshold) | (
+        (energy > threshold - VAD_SETTINGS["unvoiced_margin_db"]) & (zcr > VAD_SETTINGS["unvoiced_zcr"])
+    )
+
+    frame_ms = VAD_SETTINGS["frame_ms"]
+
+    # Bridge pauses too short to be a real break between words
+    starts, ends = _runs(~speech)
+    for start, end in zip(starts, ends):
+        if start > 0 and end < len(speech) and (end - start) * frame_ms < VAD_SETTINGS["min_silence_ms"]:
+            speech[start:end] = True
+
+    # Drop clicks and pops too short to be speech
+    starts, ends = _runs(speech)
+    for start, end in zip(starts, ends):
+        if (end - start) * frame_ms < VAD_SETTINGS["min_speech_ms"]:
+            speech[start:end] = False
+
+    return speech
+
+
+def find_speech_segments(samples, frame_rate, channels=1):
+    """Return the sentence-sized speech segments in already-loaded PCM samples."""
+    energy, zcr = frame_features(samples, frame_rate, channels)
+    speech = detect_speech(energy, zcr)
+    duration = len(samples) / channels / frame_rate
+    return merge_speech_runs(speech, duration)
+
+
+def segment_speech(wav_audio):
+    """Split the WAV audio into sentence-sized speech segments, skipping long silences."""
+    samples, frame_rate, channels = read_pcm(wav_audio)
+    return find_speech_segments(samples, frame_rate, channels)
+
+
+def pack_segments(segments, max_length, max_gap=None):
+    """Merge consecutive segments into spans of at most max_length seconds.
+
+    Segments more than max_gap seconds apart (default:
+    VAD_SETTINGS["max_pack_gap_ms"]) are never merged, so a span doesn't
+    carry a long silence to the recognizer.
+    """
+    max_gap = VAD_SETTINGS["max_pack_gap_ms"] / 1000 if max_gap is None else max_gap
+    span = None
+    for segment in segments:
+        if span and segment.end - span.start <= max_length and segment.start - span.end <= max_gap:
+            span = SpeechSegment(span.start, segment.end)
+            continue
+        if span:
+            yield span
+        span = segment
+    if span:
+        yield span
+
+
+def merge_speech_runs(speech, duration):
+    """Group runs of speech frames into segments no longer than VAD_SETTINGS["max_segment_s"]."""
+    frame_s = VAD_SETTINGS["frame_ms"] / 1000
+    pad = VAD_SETTINGS["padding_ms"] / 1000
+    max_len = VAD_SETTINGS["max_segment_s"]
+    join_gap = VAD_SETTINGS["sentence_gap_ms"] / 1000
+
+    segments = []
+    current = None
+    starts, ends = _runs(speech)
+    for start, end in zip((starts * frame_s).tolist(), (ends * frame_s).tolist()):
+        if current and start - current[1] <= join_gap and end - current[0] <= max_len:
+            current[1] = end
+            continue
+        if current:
+            segments.append(current)
+        current = [start, end]
+    if current:
+        segments.append(current)
+
+    result = []
+    previous_end = 0.0
+    for start, end in segments:
+        start, end = max(previous_end, start - pad), min(duration, end + pad)
+        previous_end = end
+        # A single unbroken run of speech longer than max_len is split evenly
+        pieces = int(np.ceil((end - start) / max_len)) or 1
+        step = (end - start) / pieces
+        result.extend(SpeechSegment(start + i * step, start + (i + 1) * step) for i in range(pieces))
+    return result
\ No newline at end of file
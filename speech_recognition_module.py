@@ -2,54 +2,101 @@
 """Speech recognition functions for the Language Audiobook Translator."""
 
 import speech_recognition as sr
-import streamlit as st
+from config import AUDIO_SETTINGS, ASR_SETTINGS
+from concurrency import ordered_map, get_limiter
+from errors import TranscriptionError
+from segmentation import read_pcm, find_speech_segments, pack_segments, mono_samples
+from cache_store import open_cache, transcription_key
+from recognizer_backends import get_recognizer_backend
 
 
-@st.cache_resource
-def init_components():
-    recognizer = sr.Recognizer()
-    # Don't cache the translator to avoid session issues
-    return recognizer
+def init_components(backend=None):
+    """Return the recognizer backend, created once per process (ASR_SETTINGS["backend"] by default)."""
+    return get_recognizer_backend(backend)
 
 
-def transcribe_audio(audio_data, source_lang):
-    """Convert speech to text with improved settings."""
-    recognizer = init_components()
+def iter_speech_chunks(audio_data, chunk_size):
+    """Yield (SpeechSegment, AudioData) pairs covering the speech in the WAV audio.
 
-    try:
-        with sr.AudioFile(audio_data) as source:
-            # Adjust for ambient noise with longer duration
-            recognizer.adjust_for_ambient_noise(source, duration=1)
-            # Record the entire audio file
-            audio = recognizer.record(source, duration=None)  # Record everything
-
-        # Try Google Speech Recognition with better settings
-        try:
-            text = recognizer.recognize_google(
-                audio,
-                language=source_lang,
-                show_all=False  # Get best result only
-            )
-            return text
-        except sr.UnknownValueError:
-            # Try with different recognition settings
-            try:
-                # Try again with show_all=True to get alternatives
-                results = recognizer.recognize_google(
-                    audio,
-                    language=source_lang,
-                    show_all=True
-                )
-                if results and 'alternative' in results:
-                    # Get the best alternative
-                    best_result = results['alternative'][0]
-                    if 'transcript' in best_result:
-                        return best_result['transcript']
-                return "Could not understand audio - try with clearer audio"
-            except:
-                return "Speech recognition failed - audio may be unclear"
+    Chunks are at most chunk_size seconds long and are built from the
+    voice-activity segments found by the segmentation stage, so they always
+    start and end in a pause, and long silences between them are never sent
+    to the recognizer. The audio is a WAV from convert_audio_format(), or
+    any other 16- or 32-bit PCM WAV; read_pcm() raises ValueError otherwise.
+    """
+    samples, frame_rate, channels = read_pcm(audio_data)
+    for span in pack_segments(find_speech_segments(samples, frame_rate, channels), chunk_size):
+        mono = mono_samples(samples, channels, int(span.start * frame_rate), int(span.end * frame_rate))
+        yield span, sr.AudioData(mono.tobytes(), frame_rate, samples.dtype.itemsize)
+
+
+def iter_audio_chunks(audio_data, chunk_size):
+    """Yield the speech in the WAV audio as AudioData pieces of at most chunk_size seconds."""
+    for _, audio in iter_speech_chunks(audio_data, chunk_size):
+        yield audio
+
+
+def transcribe_chunk(audio, source_lang, backend=None):
+    """Transcribe one chunk of audio, using the cache and retrying failed service requests.
 
+    Raises TranscriptionError once the recognizer has failed every retry.
+    """
+    recognizer = init_components(backend)
+    cache = open_cache("transcription")
+    key = transcription_key(audio, source_lang, recognizer.name, recognizer.settings())
+    text = cache.get_text(key)
+    if text is not None:
+        return text
+
+    try:
+        text = get_limiter(f"asr.{recognizer.name}").call(
+            recognizer.recognize, audio, source_lang,
+            retries=ASR_SETTINGS["max_retries"],
+            backoff=ASR_SETTINGS["retry_backoff"],
+            retry_on=(sr.RequestError,)
+        )
     except sr.RequestError as e:
-        return f"Error with speech recognition service: {e}"
-    except Exception as e:
-        return f"Transcription error: {e}"
\ No newline at end of file
+        raise TranscriptionError(f"Error with speech recognition service: {e}") from e
+    # Don't remember chunks nothing was understood in, so they get another try
+    if text:
+        cache.put_text(key, text)
+    return text
+
+
+def transcribe_chunks(audio_data, source_lang, chunk_size=AUDIO_SETTINGS["chunk_size_default"],
+                      max_workers=None, backend=None):
+    """Transcribe the audio chunk by chunk, yielding each chunk's text in order.
+
+    Chunks are sent to the recognizer concurrently on a pool of max_workers
+    threads (ASR_SETTINGS["max_workers"] by default), within the recognizer's
+    rate limit (see concurrency.get_limiter); each chunk is retried with
+    backoff on its own when the service request fails.
+    Chunks whose audio has been transcribed before come from the cache.
+    backend picks the recognizer (see recognizer_backends.RECOGNIZER_BACKENDS).
+    """
+    max_workers = max_workers or ASR_SETTINGS["max_workers"]
+
+    def recognize(audio):
+        return transcribe_chunk(audio, source_lang, backend)
+
+    yield from ordered_map(recognize, iter_audio_chunks(audio_data, chunk_size), max_workers)
+
+
+def invalidate_transcription(audio_data, source_lang, chunk_size=AUDIO_SETTINGS["chunk_size_default"],
+                             backend=None):
+    """Forget the cached transcription of every chunk of the audio, so it is recognized again."""
+    cache = open_cache("transcription")
+    recognizer = init_components(backend)
+    for audio in iter_audio_chunks(audio_data, chunk_size):
+        cache.delete(transcription_key(audio, source_lang, recognizer.name, recognizer.settings()))
+
+
+def transcribe_audio(audio_data, source_lang, chunk_size=AUDIO_SETTINGS["chunk_size_default"],
+                     max_workers=None, backend=None):
+    """Convert speech to text, sending the audio to the recognizer in chunk_size-second pieces.
+
+    Returns an empty string if no speech could be understood, and raises
+    TranscriptionError if the recognizer fails.
+    """
+    texts = transcribe_chunks(audio_data, source_lang, chunk_size, max_workers, backend)
+    return " ".join(text for text in texts if text)
\ No newline at end of file
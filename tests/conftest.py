@@ -0,0 +1,42 @@
+# conftest.py
+"""Runs the tests offline, against stores in a temporary directory."""
+
+import io
+import os
+import sys
+import tempfile
+import wave
+
+import numpy as np
+import pytest
+
+# Read by config at import time, so set before any app module is imported
+_root = tempfile.mkdtemp(prefix="audiobook-tests-")
+for _name in ("JOB", "CACHE", "METRICS", "SHARD"):
+    os.environ[f"AUDIOBOOK_{_name}_DIR"] = os.path.join(_root, _name.lower())
+for _name in ("ASR", "TRANSLATION", "TTS"):
+    os.environ[f"AUDIOBOOK_{_name}_BACKEND"] = "stub"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_wav(parts, rate=16000):
+    """A mono WAV of (kind, seconds) parts, kind being "speech" (a tone) or "silence"."""
+    samples = []
+    for kind, seconds in parts:
+        t = np.arange(int(seconds * rate)) / rate
+        level = 0.3 if kind == "speech" else 0.0
+        samples.append((level * np.sin(2 * np.pi * 220 * t) * 32767).astype("<i2"))
+    audio = io.BytesIO()
+    with wave.open(audio, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.concatenate(samples).tobytes())
+    audio.seek(0)
+    return audio
+
+
+@pytest.fixture
+def wav():
+    return make_wav
\ No newline at end of file
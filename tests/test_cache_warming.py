@@ -0,0 +1,53 @@
+# test_cache_warming.py
+"""Warming the translation cache from a finished job."""
+
+import translation_module
+from cache_store import open_cache
+from job_queue import submit_job, run_jobs
+from job_store import open_job_store
+
+
+def _count_calls(monkeypatch):
+    calls = []
+    stub = translation_module.TRANSLATION_BACKENDS["stub"]
+
+    def counting(text, source_lang, target_lang):
+        calls.append(text)
+        return stub(text, source_lang, target_lang)
+
+    monkeypatch.setitem(translation_module.TRANSLATION_BACKENDS, "stub", counting)
+    return calls
+
+
+def _run(audio):
+    job_id = submit_job(audio, "book.wav", "en", "es", 10)
+    store = open_job_store()
+    run_jobs(store.claim_jobs(store.worker, stale_after=3600))
+    assert store.get_job(job_id)["status"] == "completed"
+    return job_id
+
+
+def test_warmed_job_makes_no_translation_calls(wav, monkeypatch):
+    # Run the jobs in this process, as worker_loop() would
+    monkeypatch.setattr(open_job_store(), "worker", "test")
+    calls = _count_calls(monkeypatch)
+    parts = [("speech", 3), ("silence", 1)] * 8
+    job_id = _run(wav(parts))
+    assert calls
+
+    store = open_job_store()
+    pairs = [(segment["text"], segment["translation"]) for segment in store.segments(job_id).values()]
+    open_cache("translation").clear()
+    assert translation_module.warm_translation_cache(pairs, "en", "es", "stub") == len(pairs)
+
+    # The same book again, from scratch
+    store.delete_job(job_id)
+    calls.clear()
+    _run(wav(parts))
+    assert calls == []
+
+
+def test_pairs_that_do_not_line_up_are_skipped():
+    pairs = [("One. Two.", "Uno dos."), ("Three.", "Tres.")]
+    assert translation_module.warm_translation_cache(pairs, "en", "fr", "stub") == 1
+    assert translation_module.translate_passage("Three.", "en", "fr", backend="stub") == "Tres."
\ No newline at end of file
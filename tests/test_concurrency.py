@@ -0,0 +1,23 @@
+# test_concurrency.py
+"""Rate limits shared between processes."""
+
+from concurrency import SharedTokenBucket
+
+
+def test_buckets_on_one_file_share_their_tokens_and_rate(tmp_path):
+    path = str(tmp_path / "rate_limits.sqlite3")
+    first = SharedTokenBucket(path, "asr.test", rate=1.0, burst=2)
+    second = SharedTokenBucket(path, "asr.test", rate=1.0, burst=2)
+    assert first.take() == 0.0
+    assert second.take() == 0.0
+    assert first.take() > 0.0
+
+    second.adjust_rate(lambda rate: rate / 4)
+    first.take()
+    assert first.rate == 0.25
+
+
+def test_buckets_are_per_backend(tmp_path):
+    path = str(tmp_path / "rate_limits.sqlite3")
+    assert SharedTokenBucket(path, "asr.test", rate=1.0).take() == 0.0
+    assert SharedTokenBucket(path, "tts.test", rate=1.0).take() == 0.0
\ No newline at end of file
@@ -0,0 +1,24 @@
+# test_job_store.py
+"""Job store retention."""
+
+import time
+
+from job_store import JobStore
+
+
+def test_prune_deletes_only_old_finished_jobs(tmp_path):
+    store = JobStore(str(tmp_path))
+    for job_id, status in (("old-done", "completed"), ("old-failed", "failed"), ("old-queued", "queued")):
+        store.create_job(job_id, "book.wav", "en", "es", 10)
+        store.update_job(job_id, status=status)
+        store.save_speech(job_id, 0, b"mp3")
+    store.create_job("new-done", "book.wav", "en", "es", 10)
+    store.update_job("new-done", status="completed")
+
+    time.sleep(0.05)
+    store.update_job("new-done", status="completed")
+    assert sorted(store.prune_jobs(0.03)) == ["old-done", "old-failed"]
+    assert store.get_job("old-done") is None
+    assert store.load_speech("old-done", 0) is None
+    assert store.get_job("old-queued")["status"] == "queued"
+    assert store.get_job("new-done") is not None
\ No newline at end of file
@@ -0,0 +1,19 @@
+# test_segmentation.py
+"""Speech segmentation and packing."""
+
+from segmentation import read_pcm, find_speech_segments, pack_segments
+
+
+def test_long_silence_starts_a_new_span(wav):
+    audio = wav([("speech", 3), ("silence", 1), ("speech", 3), ("silence", 20), ("speech", 3)])
+    segments = find_speech_segments(*read_pcm(audio))
+    spans = list(pack_segments(segments, 60))
+    assert len(spans) == 2
+    assert spans[0].end < 8 and spans[1].start > 26
+
+
+def test_short_pauses_are_packed_together(wav):
+    audio = wav([("speech", 3), ("silence", 1)] * 5)
+    segments = find_speech_segments(*read_pcm(audio))
+    assert len(segments) == 5
+    assert len(list(pack_segments(segments, 60))) == 1
\ No newline at end of file
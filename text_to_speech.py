@@ -2,30 +2,165 @@
 """Text-to-speech functions for the Language Audiobook Translator."""
 
 import io
+import re
 import base64
-import streamlit as st
-from gtts import gTTS
+import tempfile
+import time
+import http_client
+from config import TTS_SETTINGS
+from concurrency import ordered_map, get_limiter
+from cache_store import open_cache, speech_key
+from errors import SynthesisError, BackendUnavailableError
+from text_utils import split_sentences, pack_batches
 
+# One silent MPEG-1 Layer III frame: 32 kbps, 44.1 kHz, mono, 1152 samples (~26 ms)
+_SILENT_FRAME = b"\xff\xfb\x10\xc0" + bytes(100)
+_SILENT_FRAME_SECONDS = 1152 / 44100
 
-def text_to_speech(text, lang):
-    """Convert text to speech and return audio data."""
+# Audio chunks in a Google Translate TTS response (see gTTS.stream())
+_GTTS_AUDIO = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+
+# Rough speaking rate used to size stand-in audio
+CHARS_PER_SECOND = 15
+
+
+def split_for_speech(text):
+    """Split text at sentence boundaries into pieces of about TTS_SETTINGS["segment_chars"]."""
+    max_chars = TTS_SETTINGS["segment_chars"]
+    for batch in pack_batches(split_sentences(text, max_chars), max_chars):
+        yield " ".join(batch)
+
+
+def silent_mp3(seconds):
+    """Return valid MP3 bytes of (about) the given number of seconds of silence."""
+    return _SILENT_FRAME * max(1, round(seconds / _SILENT_FRAME_SECONDS))
+
+
+def _synthesize_gtts(text, lang):
+    """Synthesize one segment with gTTS (Google Translate's voice).
+
+    gTTS opens a new session for every request, so its requests are sent on
+    the shared, pooled session instead and the audio is decoded the same way
+    gTTS.stream() does. Both rely on gTTS internals; should a gTTS release
+    change them, the segment is synthesized through gTTS's public
+    write_to_fp() instead.
+    """
+    from gtts import gTTS
+
+    tts = gTTS(text=text, lang=lang, slow=TTS_SETTINGS["slow"], tld=TTS_SETTINGS["gtts_tld"])
     try:
-        tts = gTTS(text=text, lang=lang, slow=False)
+        prepared_requests = tts._prepare_requests()
+    except (AttributeError, TypeError):
+        prepared_requests = None
+    audio = []
+    for prepared in prepared_requests or []:
+        response = http_client.send(prepared, timeout=TTS_SETTINGS["timeout"])
+        http_client.raise_for_status(response)
+        chunks = [match.group(1) for match in map(_GTTS_AUDIO.search, response.text.splitlines()) if match]
+        if not chunks:
+            # Not the response format we know - let gTTS decode it
+            prepared_requests = None
+            break
+        audio.extend(base64.b64decode(chunk) for chunk in chunks)
+    if prepared_requests is None:
+        fallback = io.BytesIO()
+        tts.write_to_fp(fallback)
+        return fallback.getvalue()
+    return b"".join(audio)
 
-        # Save to BytesIO object
-        audio_buffer = io.BytesIO()
-        tts.write_to_fp(audio_buffer)
-        audio_buffer.seek(0)
 
-        return audio_buffer
-    except Exception as e:
-        st.error(f"Text-to-speech error: {str(e)}")
-        return None
+def _synthesize_http(text, lang):
+    """Synthesize one segment with a GET to TTS_SETTINGS["http_url"] that answers with MP3 bytes."""
+    response = http_client.get(
+        TTS_SETTINGS["http_url"], params={'text': text, 'lang': lang}, timeout=TTS_SETTINGS["timeout"]
+    )
+    http_client.raise_for_status(response)
+    return response.content
+
+
+def _synthesize_stub(text, lang):
+    """Offline stand-in for tests and benchmarks: silence as long as the text would take to read."""
+    if TTS_SETTINGS["stub_latency"]:
+        time.sleep(TTS_SETTINGS["stub_latency"])
+    return silent_mp3(len(text) / CHARS_PER_SECOND)
+
+
+# Single-segment synthesis functions by backend name
+TTS_BACKENDS = {
+    'gtts': _synthesize_gtts,
+    'http': _synthesize_http,
+    'stub': _synthesize_stub
+}
+
 
+def get_tts_backend(name=None):
+    """Return the synthesis function of the named backend (default: TTS_SETTINGS["backend"])."""
+    name = name or TTS_SETTINGS["backend"]
+    if name not in TTS_BACKENDS:
+        raise BackendUnavailableError(f"Unknown text-to-speech backend: {name}")
+    return TTS_BACKENDS[name]
 
-def get_audio_download_link(audio_buffer, filename):
-    """Generate download link for audio file."""
-    audio_bytes = audio_buffer.getvalue()
-    b64 = base64.b64encode(audio_bytes).decode()
-    href = f'<a href="data:audio/mp3;base64,{b64}" download="{filename}">Download Translated Audiobook</a>'
-    return href
\ No newline at end of file
+
+def voice_settings():
+    """The settings that change how synthesized speech sounds - part of the TTS cache key."""
+    return f"tld={TTS_SETTINGS['gtts_tld']};slow={TTS_SETTINGS['slow']}"
+
+
+def synthesize_segment(text, lang, backend=None):
+    """Synthesize one segment of text and return its MP3 bytes."""
+    return get_tts_backend(backend)(text, lang)
+
+
+def synthesize_segments(text, lang, max_workers=None, backend=None):
+    """Yield the MP3 audio of the text segment by segment, in order, as soon as each is ready.
+
+    Segments are synthesized concurrently on a bounded pool of max_workers
+    threads (TTS_SETTINGS["max_workers"] by default), within the backend's
+    rate limit (see concurrency.get_limiter), so only a handful of segments
+    are ever held in memory at once. Segments synthesized before with the
+    same language, voice settings and backend come from the "tts" cache, so
+    editing one sentence only costs one request.
+    """
+    max_workers = max_workers or TTS_SETTINGS["max_workers"]
+    backend = backend or TTS_SETTINGS["backend"]
+    get_tts_backend(backend)  # Fail fast on an unknown backend rather than retrying it
+    limiter = get_limiter(f"tts.{backend}")
+    cache = open_cache("tts")
+    voice = voice_settings()
+
+    def synthesize(segment):
+        key = speech_key(segment, lang, voice, backend)
+        audio = cache.get(key)
+        if audio is None:
+            audio = limiter.call(
+                synthesize_segment, segment, lang, backend,
+                retries=TTS_SETTINGS["max_retries"],
+                backoff=TTS_SETTINGS["retry_backoff"]
+            )
+            cache.put(key, audio)
+        return audio
+
+    yield from ordered_map(synthesize, split_for_speech(text), max_workers)
+
+
+def text_to_speech(text, lang, output=None, backend=None):
+    """Convert text to speech, writing the MP3 to output as each segment finishes.
+
+    MP3 frames can simply be concatenated, so each segment is appended to the
+    output stream in order. Without an output stream the audio goes to a
+    spooled temporary file that moves to disk once it outgrows
+    TTS_SETTINGS["spool_max_bytes"]. Returns the stream, rewound to the start;
+    raises SynthesisError if synthesis fails.
+    """
+    try:
+        if output is None:
+            output = tempfile.SpooledTemporaryFile(max_size=TTS_SETTINGS["spool_max_bytes"], suffix=".mp3")
+
+        for audio in synthesize_segments(text, lang, backend=backend):
+            output.write(audio)
+            output.flush()
+
+        output.seek(0)
+        return output
+    except Exception as e:
+        raise SynthesisError(f"Text-to-speech error: {str(e)}") from e
\ No newline at end of file
@@ -0,0 +1,47 @@
+# text_utils.py
+"""Text segmentation helpers for the Language Audiobook Translator."""
+
+import re
+
+SENTENCE_END = re.compile(r'(?<=[.!?。！？])\s+')
+
+# Languages written without spaces between sentences
+NO_SPACE_LANGUAGES = {'zh-cn', 'zh', 'ja'}
+
+
+def split_sentences(text, max_chars):
+    """Split text into sentence segments no longer than max_chars."""
+    segments = []
+    for sentence in SENTENCE_END.split(text):
+        # Collapse whitespace - newlines are used as a delimiter when segments are packed
+        sentence = " ".join(sentence.split())
+        while len(sentence) > max_chars:
+            # Overlong sentence - break it at the last space that fits
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            segments.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if sentence:
+            segments.append(sentence)
+    return segments
+
+
+def pack_batches(segments, max_chars, separator_len=1):
+    """Pack consecutive segments into batches whose joined length fits in max_chars."""
+    batch, length = [], 0
+    for segment in segments:
+        added = len(segment) + (separator_len if batch else 0)
+        if batch and length + added > max_chars:
+            yield batch
+            batch, length = [], 0
+            added = len(segment)
+        batch.append(segment)
+        length += added
+    if batch:
+        yield batch
+
+
+def join_segments(segments, target_lang):
+    """Join translated segments back into running text."""
+    separator = "" if target_lang in NO_SPACE_LANGUAGES else " "
+    return separator.join(segments)
\ No newline at end of file
@@ -1,95 +1,257 @@
 # translation_module.py
 """Translation functions for the Language Audiobook Translator."""
 
-from googletrans import Translator
+import threading
 import time
+import http_client
+from config import TRANSLATION_SETTINGS
+from concurrency import ordered_map, get_limiter
+from errors import BackendUnavailableError, TranslationError, RateLimitedError
+from cache_store import open_cache, translation_key
+from text_utils import split_sentences, pack_batches, join_segments
+
+# Segments are packed into one request separated by this, and split back apart on it
+SEGMENT_DELIMITER = "\n"
+
+# Translator clients are reused across batches, one per worker thread
+_clients = threading.local()
 
 
 # Create translator instances as needed to avoid caching issues
 def get_fresh_translator():
     """Get a fresh translator instance to avoid async issues."""
+    # Imported on first use, so loading this module doesn't load googletrans and httpx
+    from googletrans import Translator
+
     return Translator()
 
 
-def translate_text(text, source_lang, target_lang):
-    """Translate text from source to target language."""
-    try:
-        # First try the alternative method (more reliable)
-        return translate_text_alternative(text, source_lang, target_lang)
-    except:
-        # If alternative fails, try googletrans with proper handling
-        try:
-            time.sleep(0.5)  # Brief delay
-            fresh_translator = get_fresh_translator()
-            translation = fresh_translator.translate(text, src=source_lang, dest=target_lang)
-
-            # Check if it's a coroutine (async object)
-            if hasattr(translation, '__await__'):
-                return "Error: Received async object - please install deep_translator"
-
-            # Check if it has text attribute
-            if hasattr(translation, 'text'):
-                result = translation.text
-                # Ensure it's not a coroutine string representation
-                if 'coroutine' in str(result).lower():
-                    return "Error: Translation returned coroutine object"
-                return result
-            else:
-                return "Error: Translation object missing text attribute"
+def _thread_client(key, factory):
+    """Return this thread's translator client for key, creating it on first use."""
+    clients = getattr(_clients, 'clients', None)
+    if clients is None:
+        clients = _clients.clients = {}
+    if key not in clients:
+        clients[key] = factory()
+    return clients[key]
 
-        except Exception as e:
-            return f"Translation error: {str(e)}"
 
+def _translate_packed(batch, translate_one, source_lang, target_lang):
+    """Translate a batch of segments in one request, splitting it up if the delimiters get lost."""
+    if len(batch) == 1:
+        return [translate_one(batch[0], source_lang, target_lang).strip()]
 
-def translate_text_alternative(text, source_lang, target_lang):
-    """Alternative translation using deep_translator - more reliable."""
-    try:
-        from deep_translator import GoogleTranslator
+    translated = translate_one(SEGMENT_DELIMITER.join(batch), source_lang, target_lang)
+    parts = [part.strip() for part in translated.strip().split(SEGMENT_DELIMITER)]
+    if len(parts) == len(batch):
+        return parts
+
+    # The backend merged or split lines - halve the batch until segments line up again
+    middle = len(batch) // 2
+    return (_translate_packed(batch[:middle], translate_one, source_lang, target_lang) +
+            _translate_packed(batch[middle:], translate_one, source_lang, target_lang))
+
+
+def translate_segments(segments, source_lang, target_lang, translate_one, backend, max_workers=None):
+    """Translate a list of segments with translate_one, batching them into as few requests as possible.
+
+    Segments already in the translation cache for this backend are not sent
+    again. The rest are batched, sent concurrently within the backend's rate
+    limit (see concurrency.get_limiter), and cached; the translated segments
+    come back in the same order as the input.
+    """
+    max_workers = max_workers or TRANSLATION_SETTINGS["max_workers"]
+    cache = open_cache("translation")
+
+    translated = [cache.get_text(translation_key(segment, source_lang, target_lang, backend))
+                  for segment in segments]
+    missing = [index for index, text in enumerate(translated) if text is None]
 
-        # Handle language code differences
-        lang_mapping = {
-            'zh-cn': 'zh',
-            'zh': 'zh-cn'
-        }
+    limiter = get_limiter(f"translation.{backend}")
 
-        source_mapped = lang_mapping.get(source_lang, source_lang)
-        target_mapped = lang_mapping.get(target_lang, target_lang)
+    def translate_request(text, source_lang, target_lang):
+        return limiter.call(
+            translate_one, text, source_lang, target_lang,
+            retries=TRANSLATION_SETTINGS["max_retries"],
+            backoff=TRANSLATION_SETTINGS["retry_backoff"]
+        )
 
-        translator = GoogleTranslator(source=source_mapped, target=target_mapped)
+    def translate_batch(batch):
+        return _translate_packed(batch, translate_request, source_lang, target_lang)
+
+    results = []
+    batches = pack_batches(
+        (segments[i] for i in missing), TRANSLATION_SETTINGS["max_chars"], len(SEGMENT_DELIMITER)
+    )
+    for parts in ordered_map(translate_batch, batches, max_workers):
+        results.extend(parts)
+
+    for index, text in zip(missing, results):
+        translated[index] = text
+        cache.put_text(translation_key(segments[index], source_lang, target_lang, backend), text)
+    return translated
+
+
+def _translate_googletrans(text, source_lang, target_lang):
+    """Translate one request's worth of text with googletrans."""
+    translator = _thread_client(('googletrans',), get_fresh_translator)
+    translation = translator.translate(text, src=source_lang, dest=target_lang)
+
+    # Check if it's a coroutine (async object)
+    if hasattr(translation, '__await__'):
+        raise RuntimeError("Received async object - please install deep_translator")
+
+    # Check if it has text attribute
+    if not hasattr(translation, 'text'):
+        raise RuntimeError("Translation object missing text attribute")
+
+    result = translation.text
+    # Ensure it's not a coroutine string representation
+    if 'coroutine' in str(result).lower():
+        raise RuntimeError("Translation returned coroutine object")
+    return result
+
+
+def _translate_deep_translator(text, source_lang, target_lang):
+    """Translate one request's worth of text with deep_translator's GoogleTranslator."""
+    from deep_translator import GoogleTranslator
+    from deep_translator.exceptions import TooManyRequests
+
+    # Handle language code differences
+    lang_mapping = {
+        'zh-cn': 'zh',
+        'zh': 'zh-cn'
+    }
+
+    source_mapped = lang_mapping.get(source_lang, source_lang)
+    target_mapped = lang_mapping.get(target_lang, target_lang)
+
+    translator = _thread_client(
+        ('deep_translator', source_mapped, target_mapped),
+        lambda: GoogleTranslator(source=source_mapped, target=target_mapped)
+    )
+    try:
         result = translator.translate(text)
+    except TooManyRequests as e:
+        raise RateLimitedError("Google Translate is rate limiting requests") from e
 
-        # Ensure we got a valid string result
-        if result and isinstance(result, str) and 'coroutine' not in result.lower():
-            return result
-        else:
-            return f"Alternative translation failed: Invalid result format"
+    # Ensure we got a valid string result
+    if result and isinstance(result, str) and 'coroutine' not in result.lower():
+        return result
+    raise RuntimeError("Invalid result format")
 
+
+def _translate_googleapis(text, source_lang, target_lang):
+    """Translate one request's worth of text with a direct call to the Google Translate API."""
+    # Simple Google Translate API call
+    base_url = TRANSLATION_SETTINGS["googleapis_url"]
+    params = {
+        'client': 'gtx',
+        'sl': source_lang,
+        'tl': target_lang,
+        'dt': 't',
+        'q': text
+    }
+
+    response = http_client.get(base_url, params=params, timeout=TRANSLATION_SETTINGS["timeout"])
+    http_client.raise_for_status(response)
+    result = response.json()
+
+    if result and len(result) > 0 and len(result[0]) > 0:
+        # The API returns the translation sentence by sentence
+        return "".join(part[0] for part in result[0] if part and part[0])
+    raise RuntimeError("Invalid API response")
+
+
+def _translate_stub(text, source_lang, target_lang):
+    """Offline stand-in for tests and benchmarks: tags every line with the target language."""
+    if TRANSLATION_SETTINGS["stub_latency"]:
+        time.sleep(TRANSLATION_SETTINGS["stub_latency"])
+    return SEGMENT_DELIMITER.join(f"[{target_lang}] {line}" for line in text.split(SEGMENT_DELIMITER))
+
+
+# Single-request translation functions by backend name
+TRANSLATION_BACKENDS = {
+    'deep_translator': _translate_deep_translator,
+    'googleapis': _translate_googleapis,
+    'googletrans': _translate_googletrans,
+    'stub': _translate_stub
+}
+
+
+def translation_backends(backend=None):
+    """Names of the backends to try in turn for backend (default: TRANSLATION_SETTINGS["backend"])."""
+    backend = backend or TRANSLATION_SETTINGS["backend"]
+    if backend != 'auto':
+        if backend not in TRANSLATION_BACKENDS:
+            raise BackendUnavailableError(f"Unknown translation backend: {backend}")
+        return [backend]
+    try:
+        import deep_translator
+        first = 'deep_translator'
     except ImportError:
-        # Try a simple requests-based approach as final fallback
-        try:
-            import requests
-            import urllib.parse
-
-            # Simple Google Translate API call
-            base_url = "https://translate.googleapis.com/translate_a/single"
-            params = {
-                'client': 'gtx',
-                'sl': source_lang,
-                'tl': target_lang,
-                'dt': 't',
-                'q': text
-            }
-
-            response = requests.get(base_url, params=params, timeout=10)
-            result = response.json()
-
-            if result and len(result) > 0 and len(result[0]) > 0:
-                return result[0][0][0]
-            else:
-                return "Translation failed: Invalid API response"
+        first = 'googleapis'
+    # Last resort - googletrans
+    return [first, 'googletrans']
+
 
+def translate_passage(text, source_lang, target_lang, max_workers=None, backend=None):
+    """Translate text with the selected backend (or the most reliable one available).
+
+    Raises TranslationError if every backend fails.
+    """
+    segments = split_sentences(text, TRANSLATION_SETTINGS["max_chars"])
+    names = translation_backends(backend)
+    for name in names:
+        try:
+            translated = translate_segments(
+                segments, source_lang, target_lang, TRANSLATION_BACKENDS[name], name, max_workers
+            )
+            return join_segments(translated, target_lang)
         except Exception as e:
-            return f"All translation methods failed. Please install: pip install deep_translator"
+            if name == names[-1]:
+                raise TranslationError(f"Translation error: {str(e)}") from e
+
+
+def warm_translation_cache(pairs, source_lang, target_lang, backend=None):
+    """Seed the translation cache from the (transcript, translation) pairs of a finished job.
 
-    except Exception as e:
-        return f"Alternative translation error: {str(e)}"
\ No newline at end of file
+    Both sides are split into sentences the way translate_passage() splits
+    its input, so the seeded entries are the ones it looks up. Pairs that
+    don't split into the same number of sentences can't be lined up and are
+    skipped. Returns the number of sentences added.
+    """
+    # translate_passage() looks in the cache of the first backend it tries
+    name = translation_backends(backend)[0]
+    cache = open_cache("translation")
+    added = 0
+    for text, translation in pairs:
+        if not text or not translation:
+            continue
+        sources = split_sentences(text, TRANSLATION_SETTINGS["max_chars"])
+        targets = split_sentences(translation, TRANSLATION_SETTINGS["max_chars"])
+        if len(sources) != len(targets):
+            continue
+        for source, target in zip(sources, targets):
+            key = translation_key(source, source_lang, target_lang, name)
+            if cache.get_text(key) is None:
+                cache.put_text(key, target)
+                added += 1
+    return added
+
+
+def translate_text(text, source_lang, target_lang):
+    """Translate text from source to target language, raising TranslationError on failure."""
+    # Backoff and throttling are handled per backend by the rate limiter
+    return translate_passage(text, source_lang, target_lang, backend='auto')
+
+
+def translate_text_alternative(text, source_lang, target_lang):
+    """Alternative translation using deep_translator - more reliable. Raises TranslationError on failure."""
+    try:
+        import deep_translator
+        backend = 'deep_translator'
+    except ImportError:
+        # Try a simple requests-based approach as final fallback
+        backend = 'googleapis'
+    return translate_passage(text, source_lang, target_lang, backend=backend)
\ No newline at end of file
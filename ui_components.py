@@ -2,7 +2,9 @@
 """UI components and layout functions for the Language Audiobook Translator."""
 
 import streamlit as st
-from config import LANGUAGES, SUPPORTED_AUDIO_FORMATS, AUDIO_SETTINGS
+import os
+from config import LANGUAGES, RECOGNIZERS, SUPPORTED_AUDIO_FORMATS, AUDIO_SETTINGS, JOB_SETTINGS
+from errors import FFmpegNotFoundError
 
 
 def render_header():
@@ -32,14 +34,22 @@ def render_input_section():
             index=0
         )
 
+        # Speech recognizer
+        recognizer = st.selectbox(
+            "Speech Recognizer",
+            options=list(RECOGNIZERS.keys()),
+            index=0,
+            help="Offline recognizers run on this machine and need their model installed"
+        )
+
     with col2:
         st.subheader("🎯 Output Settings")
 
-        # Target language
-        target_language = st.selectbox(
-            "Target Language (Translate to)",
+        # Target languages - the audio is transcribed once however many are picked
+        target_languages = st.multiselect(
+            "Target Languages (Translate to)",
             options=list(LANGUAGES.keys()),
-            index=1
+            default=[list(LANGUAGES.keys())[1]]
         )
 
         # Processing options
@@ -51,7 +61,7 @@ def render_input_section():
             help="Larger chunks may be more accurate but take longer to process"
         )
 
-    return uploaded_file, source_language, target_language, chunk_size
+    return uploaded_file, source_language, target_languages, chunk_size, RECOGNIZERS[recognizer]
 
 
 def display_file_info(uploaded_file):
@@ -64,8 +74,71 @@ def display_file_info(uploaded_file):
     st.json(file_details)
 
 
-def display_transcription_results(transcribed_text, audio_info=None):
-    """Display transcription results with warnings for short transcriptions."""
+def display_conversion_error(error):
+    """Display an audio conversion error with suggestions for fixing it."""
+    if isinstance(error, FFmpegNotFoundError):
+        # FFmpeg not found - provide user-friendly error with solutions
+        st.error("""
+        🚨 **FFmpeg Not Found!**
+
+        **Quick Fixes (choose one):**
+
+        1️⃣ **Easiest - Use WAV files:**
+           - Convert your audio to WAV format first
+           - Use VLC Player: Media → Convert/Save
+           - Or use online converter: convertio.co
+
+        2️⃣ **Install FFmpeg:**
+           ```
+           # In Command Prompt as Administrator:
+           winget install FFmpeg
+           ```
+
+        3️⃣ **Alternative install:**
+           ```
+           pip install imageio[ffmpeg]
+           ```
+        """)
+    else:
+        # For other errors, try alternative approach
+        st.warning(str(error))
+        st.info("💡 **Try uploading a WAV file instead** - no conversion needed!")
+
+
+def display_job_progress(job, transcribed_text, translated_text):
+    """Display a queued or running job's progress and the text finished so far."""
+    if job["status"] == "running":
+        st.progress(job["fraction"])
+        if job["duration"]:
+            st.text(f"Processed {job['done']:.0f}s of {job['duration']:.0f}s of audio...")
+            stages = job["stages"]
+            st.caption(f"Segments: {stages['transcribed']} transcribed, {stages['translated']} translated, "
+                       f"{stages['synthesized']} synthesized")
+        else:
+            st.text("Converting audio format...")
+    else:
+        st.progress(0)
+        ahead = job["position"]
+        st.text(f"Waiting for a worker - {ahead} job{'s' if ahead != 1 else ''} ahead in the queue..."
+                if ahead else "Waiting for a worker...")
+
+    if job["chapter_paths"]:
+        with st.expander("🎧 Listen to the finished chapters"):
+            render_chapter_player(job["chapter_paths"], job["id"])
+
+    if transcribed_text:
+        with st.expander("📝 Transcribed so far"):
+            st.write(transcribed_text)
+    if translated_text:
+        with st.expander("🔄 Translated so far"):
+            st.write(translated_text)
+
+
+def display_transcription_results(transcribed_text, audio_info=None, key=None):
+    """Display transcription results with warnings for short transcriptions.
+
+    key tells the widgets apart when several jobs are shown on one page.
+    """
     st.subheader("📝 Transcribed Text")
 
     # Show audio file info if available
@@ -74,7 +147,7 @@ def display_transcription_results(transcribed_text, audio_info=None):
 
     col1, col2 = st.columns([3, 1])
     with col1:
-        st.text_area("Original text:", transcribed_text, height=100)
+        st.text_area("Original text:", transcribed_text, height=100, key=f"original_{key}")
     with col2:
         st.metric("Characters", len(transcribed_text))
 
@@ -86,29 +159,67 @@ def display_transcription_results(transcribed_text, audio_info=None):
         st.write("- Microphone too far from speaker")
         st.write("- Audio file corruption")
 
-        if st.button("🔄 Try Again with Different Settings"):
+        if st.button("🔄 Try Again with Different Settings", key=f"try_again_{key}"):
             st.rerun()
 
 
-def display_translation_results(translated_text):
+def display_translation_results(translated_text, key=None):
     """Display translation results."""
     st.subheader("🔄 Translated Text")
-    st.text_area("Translated text:", translated_text, height=100)
-
-
-def display_final_results(audio_buffer, uploaded_file, transcribed_text, translated_text, source_language,
-                          target_language):
-    """Display final results with audio player and download link."""
-    from text_to_speech import get_audio_download_link
-
+    st.text_area("Translated text:", translated_text, height=100, key=f"translated_{key}")
+
+
+def render_chapter_player(chapter_paths, key=None):
+    """Play one chapter of the translated audiobook at a time, from its file; returns the chapter's index."""
+    number = st.selectbox(
+        "Chapter",
+        options=range(len(chapter_paths)),
+        format_func=lambda n: f"Chapter {n + 1} of {len(chapter_paths)}",
+        key=f"chapter_{key}"
+    )
+    st.audio(chapter_paths[number], format='audio/mp3')
+    return number
+
+
+def _read_file(path):
+    """A callable that reads path, so a download button only reads the file once clicked."""
+    def read():
+        with open(path, "rb") as audio_file:
+            return audio_file.read()
+    return read
+
+
+def display_final_results(audio_path, chapter_paths, filename, transcribed_text, translated_text,
+                          source_language, target_language, key=None):
+    """Display final results with audio player and download button.
+
+    Streamlit can't stream a download from disk: the clicked file is read
+    into the server's memory and kept there for the session. So books over
+    JOB_SETTINGS["max_download_bytes"] are offered a chapter at a time, which
+    bounds that to one chapter file; the whole MP3 stays in the job store
+    (and cli.py writes it straight to disk).
+    """
     st.subheader("🎵 Results")
 
-    # Play audio
-    st.audio(audio_buffer.getvalue(), format='audio/mp3')
-
-    # Download link
-    download_filename = f"translated_{uploaded_file.name.split('.')[0]}.mp3"
-    st.markdown(get_audio_download_link(audio_buffer, download_filename), unsafe_allow_html=True)
+    # Play audio a chapter at a time, so the page never holds the whole book
+    if chapter_paths:
+        number = render_chapter_player(chapter_paths, key)
+    else:
+        st.info("🎧 Download the audiobook to listen to it.")
+
+    stem = filename.split('.')[0]
+    if chapter_paths and os.path.getsize(audio_path) > JOB_SETTINGS["max_download_bytes"]:
+        st.download_button(
+            f"📥 Download Chapter {number + 1}", _read_file(chapter_paths[number]),
+            file_name=f"translated_{stem}_{target_language}_{number + 1:03d}.mp3", mime="audio/mpeg",
+            key=f"download_{key}_{number}"
+        )
+        st.caption("This audiobook is too long to download in one piece, so it's downloaded a chapter at a time.")
+    else:
+        st.download_button(
+            "📥 Download Translated Audiobook", _read_file(audio_path),
+            file_name=f"translated_{stem}_{target_language}.mp3", mime="audio/mpeg", key=f"download_{key}"
+        )
 
     # Statistics
     col1, col2, col3 = st.columns(3)